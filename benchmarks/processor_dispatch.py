@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+"""Processor dispatch microbenchmark.
+
+Compares the persistent worker pool with the old design, where add_work
+spawned a worker (up to concurrency) and workers exited as soon as the queue
+was empty or had run 20 jobs. The pool is measured with and without
+replacing its workers after 20 jobs too.
+
+Usage:
+  processor_dispatch.py [--jobs=<n>] [--concurrency=<n>] [--burst=<n>]
+
+Options:
+  --jobs=<n>         Number of no-op actions to run for each measurement [default: 20000]
+  --concurrency=<n>  Number of workers [default: 4]
+  --burst=<n>        Actions added per burst in the latency measurement [default: 10]
+"""
+
+import time
+
+from gevent import sleep
+
+from slaveapi.actions.results import SUCCESS
+from slaveapi.global_state import messenger
+from slaveapi.processor import Processor
+
+
+class SpawnOnAddProcessor(Processor):
+    """The worker lifecycle that the Processor had before it used a
+    persistent pool."""
+    def configure(self, concurrency, shares=None, max_jobs=20, reserved=1):
+        Processor.configure(self, concurrency, shares, max_jobs, reserved)
+
+    def _resize(self):
+        pass
+
+    def _enqueue(self, item):
+        Processor._enqueue(self, item)
+        if len(self.workers) < self.concurrency:
+            self._start_worker()
+
+    def _worker_done(self, t):
+        self.workers.remove(t)
+        if self.work_queue.runnable() and not self.stopped:
+            if len(self.workers) < self.concurrency:
+                self._start_worker()
+
+    def _worker(self):
+        jobs = 0
+        while jobs < self.max_jobs:
+            item = self.work_queue.get()
+            if not item:
+                break
+            jobs += 1
+            self._process(item)
+
+
+def make_processor(cls, concurrency, max_jobs):
+    processor = cls()
+    processor.spawned = 0
+    start_worker = processor._start_worker
+    def counting_start_worker():
+        processor.spawned += 1
+        start_worker()
+    processor._start_worker = counting_start_worker
+    processor.configure(concurrency, max_jobs=max_jobs)
+    processor.spawned = 0
+    return processor
+
+
+def noop(name, started=None):
+    if started is not None:
+        started.append(time.time())
+    return SUCCESS, "ok"
+
+
+def measure_throughput(processor, jobs):
+    start = time.time()
+    results = [processor.submit("slave%d" % i, noop, coalesce=False)
+               for i in xrange(jobs)]
+    for res in results:
+        res.wait()
+    return jobs / (time.time() - start)
+
+
+def measure_latency(processor, jobs, burst):
+    latencies = []
+    for n in xrange(jobs / burst):
+        started = []
+        queued = time.time()
+        results = [processor.submit("slave%d" % i, noop, (), {"started": started},
+                                    coalesce=False)
+                   for i in xrange(burst)]
+        for res in results:
+            res.wait()
+        latencies.extend(t - queued for t in started)
+        # Let the pool go idle between bursts.
+        sleep(0.001)
+    latencies.sort()
+    return latencies
+
+
+def main(jobs, concurrency, burst):
+    messenger.start()
+    print "%d jobs, concurrency %d, bursts of %d" % (jobs, concurrency, burst)
+    print "%-16s %12s %10s %10s %10s %10s" % (
+        "design", "jobs/sec", "p50 (us)", "p99 (us)", "max (us)", "spawns")
+    for name, cls, max_jobs in (("spawn-on-add", SpawnOnAddProcessor, 20),
+                                ("pool, recycled", Processor, 20),
+                                ("persistent pool", Processor, None)):
+        processor = make_processor(cls, concurrency, max_jobs)
+        throughput = measure_throughput(processor, jobs)
+        latencies = measure_latency(processor, jobs, burst)
+        print "%-16s %12.0f %10.1f %10.1f %10.1f %10d" % (
+            name, throughput,
+            latencies[len(latencies) / 2] * 1e6,
+            latencies[int(len(latencies) * 0.99)] * 1e6,
+            latencies[-1] * 1e6,
+            processor.spawned)
+        processor.configure(0)
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+    args = docopt(__doc__)
+    main(int(args["--jobs"]), int(args["--concurrency"]), int(args["--burst"]))
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+"""SSHConsole latency benchmark.
+
+Runs SSHConsole against in-process stand-in SSH servers (see ssh_server.py),
+one for each kind of host, and measures how long it takes to connect and log
+in, to get a ready shell, and to run a command. Commands are run from several
+greenlets at once through a shared connection pool, the way the server runs
+actions, which also gives the command throughput.
+
+Usage:
+  ssh_console.py [--hosts=<types>] [--greenlets=<n>] [--commands=<n>] [--samples=<n>] [--json]
+
+Options:
+  --hosts=<types>   Comma separated host types to benchmark [default: bash,windows,slow,flaky]
+  --greenlets=<n>   Number of greenlets running commands at once [default: 10]
+  --commands=<n>    Commands run by each greenlet [default: 10]
+  --samples=<n>     Connects and shells to time for each host type [default: 5]
+  --json            Print the results as JSON, eg, to keep as a baseline
+"""
+
+from gevent import monkey
+monkey.patch_all()
+
+import json
+import logging
+import time
+
+import gevent
+
+from slaveapi.clients.ssh import SSHConsole, SSHConnectionPool, CredentialCache
+from slaveapi.facts import HostFacts
+
+from ssh_server import StandInSSHServer
+
+# The first password is wrong on "flaky" hosts.
+CREDENTIALS = {"cltbld": ["password", "newpassword"]}
+COMMANDS = {"windows": "net statistics server"}
+
+
+class Bench(object):
+    """A stand-in host and what a SlaveAPI server would share between the
+    consoles that talk to it."""
+    def __init__(self, host_type, address):
+        self.host_type = host_type
+        self.server = StandInSSHServer(host_type, CREDENTIALS, address=address).start()
+        self.pool = SSHConnectionPool()
+        self.credential_cache = CredentialCache()
+        self.facts = HostFacts()
+        self.command = COMMANDS.get(host_type, "uptime")
+
+    def console(self, pool=True):
+        return SSHConsole(self.server.address, CREDENTIALS, port=self.server.port,
+                          pool=self.pool if pool else None,
+                          name="%s-slave-1" % self.host_type,
+                          credential_cache=self.credential_cache, facts=self.facts)
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    return {
+        "p50": latencies[len(latencies) / 2] * 1000,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1000,
+        "max": latencies[-1] * 1000,
+    }
+
+
+def measure_connect(bench, samples):
+    """Times fresh connections and logins, without the pool."""
+    latencies = []
+    for _ in xrange(samples):
+        console = bench.console(pool=False)
+        start = time.time()
+        console.connect()
+        latencies.append(time.time() - start)
+        console.disconnect()
+    return summarize(latencies)
+
+
+def measure_shell(bench, samples):
+    """Times how long it takes for a new pty shell to become ready."""
+    latencies = []
+    console = bench.console()
+    console.connect()
+    for _ in xrange(samples):
+        start = time.time()
+        shell = console._get_shell()
+        latencies.append(time.time() - start)
+        shell.close()
+    console.disconnect()
+    return summarize(latencies)
+
+
+def measure_commands(bench, greenlets, commands):
+    """Runs commands from "greenlets" greenlets at once, each getting its
+    console the way actions do. Returns latencies and throughput."""
+    latencies = []
+
+    def run():
+        for _ in xrange(commands):
+            start = time.time()
+            rc, output = bench.console().run_cmd(bench.command)
+            latencies.append(time.time() - start)
+            assert rc == 0, output
+
+    start = time.time()
+    gevent.joinall([gevent.spawn(run) for _ in xrange(greenlets)], raise_error=True)
+    elapsed = time.time() - start
+    result = summarize(latencies)
+    result["per_sec"] = len(latencies) / elapsed
+    return result
+
+
+def main(host_types, greenlets, commands, samples, as_json):
+    logging.basicConfig(level=logging.WARNING)
+    results = {}
+    if not as_json:
+        print "%d greenlets running %d commands each, %d connect/shell samples, times in ms" % (
+            greenlets, commands, samples)
+        print "%-8s %16s %16s %24s %9s %6s %6s" % (
+            "host", "connect p50/p99", "shell p50/p99", "command p50/p99/max",
+            "cmds/sec", "conns", "auths")
+    for i, host_type in enumerate(host_types):
+        # Each host gets its own loopback address so that they're kept
+        # apart in the pool and facts.
+        bench = Bench(host_type, "127.0.0.%d" % (i + 2))
+        result = results[host_type] = {
+            "connect": measure_connect(bench, samples),
+            "shell": measure_shell(bench, samples),
+            "command": measure_commands(bench, greenlets, commands),
+        }
+        result["connections"] = bench.server.connections
+        result["auth_attempts"] = bench.server.auth_attempts
+        if not as_json:
+            print "%-8s %16s %16s %24s %9.1f %6d %6d" % (
+                host_type,
+                "%.1f/%.1f" % (result["connect"]["p50"], result["connect"]["p99"]),
+                "%.1f/%.1f" % (result["shell"]["p50"], result["shell"]["p99"]),
+                "%.1f/%.1f/%.1f" % (result["command"]["p50"], result["command"]["p99"],
+                                    result["command"]["max"]),
+                result["command"]["per_sec"],
+                result["connections"], result["auth_attempts"])
+    if as_json:
+        print json.dumps(results, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+    args = docopt(__doc__)
+    main(args["--hosts"].split(","), int(args["--greenlets"]), int(args["--commands"]),
+         int(args["--samples"]), args["--json"])
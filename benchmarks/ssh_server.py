@@ -0,0 +1,217 @@
+"""An in-process SSH server that stands in for slaves.
+
+It emulates the kinds of hosts that SSHConsole has to deal with:
+
+* "bash": a Unix host that supports both "exec" and pty shells.
+* "windows": a Windows host whose commands go through an msys bash. "uptime"
+  doesn't exist there, but "net statistics server" does, and "exec" requests
+  are refused so the console has to use a pty shell.
+* "slow": like "bash", but its shell takes a while to start up (like the
+  hosts in bug 943508).
+* "flaky": like "bash", but the first password of every username is rejected.
+
+Commands that a host doesn't have canned output for are run with the local
+/bin/sh, so scripts behave the way they would on a real host. Their output is
+streamed as it's written, so long running commands like "tail -F" work too.
+
+This must be used with gevent's monkey patching in place, because paramiko
+runs its server side in threads. For example:
+
+    server = StandInSSHServer("windows", {"cltbld": ["password"]}).start()
+    console = SSHConsole(server.address, {"cltbld": ["password"]}, port=server.port)
+    print console.run_cmd("net statistics server")
+"""
+
+import socket
+import subprocess
+import threading
+import time
+
+import paramiko
+from gevent.os import make_nonblocking, nb_read
+
+UNIX_UPTIME = " 10:38:58 up 78 days, 21:57,  3 users,  load average: 0.01, 0.07, 0.13"
+WINDOWS_STATISTICS = """Server Statistics for \\\\W64-IX-SLAVE05
+
+
+Statistics since 3/26/2014 7:14:07 AM
+
+
+Sessions accepted                  1
+The command completed successfully.
+"""
+
+# msys bash's default prompt takes two lines.
+UNIX_PROMPT = "user@host $ "
+MSYS_PROMPT = "\r\nuser@W64-IX-SLAVE05 ~\r\n$ "
+
+HOST_TYPES = {
+    "bash": {"exec": True, "shell_delay": 0, "flaky_auth": False, "prompt": UNIX_PROMPT,
+             "commands": {"uptime": (0, UNIX_UPTIME)}},
+    "windows": {"exec": False, "shell_delay": 0, "flaky_auth": False, "prompt": MSYS_PROMPT,
+                "commands": {"uptime": (127, "bash: uptime: command not found"),
+                             "uname -s": (0, "MINGW32_NT-6.1"),
+                             "net statistics server": (0, WINDOWS_STATISTICS)}},
+    "slow": {"exec": True, "shell_delay": 3, "flaky_auth": False, "prompt": UNIX_PROMPT,
+             "commands": {"uptime": (0, UNIX_UPTIME)}},
+    "flaky": {"exec": True, "shell_delay": 0, "flaky_auth": True, "prompt": UNIX_PROMPT,
+              "commands": {"uptime": (0, UNIX_UPTIME)}},
+}
+
+
+class Server(paramiko.ServerInterface):
+    def __init__(self, stand_in):
+        self.stand_in = stand_in
+        self.host = HOST_TYPES[stand_in.host_type]
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        self.stand_in.auth_attempts += 1
+        passwords = self.stand_in.credentials.get(username, [])
+        if self.host["flaky_auth"] and passwords and password == passwords[0]:
+            return paramiko.AUTH_FAILED
+        if password in passwords:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, *args):
+        self.stand_in.pty_requests += 1
+        return True
+
+    def check_channel_shell_request(self, channel):
+        self.stand_in.spawn(self.stand_in.serve_shell, channel)
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        if not self.host["exec"]:
+            return False
+        self.stand_in.spawn(self.stand_in.serve_exec, channel, command)
+        return True
+
+
+class StandInSSHServer(object):
+    """Listens on a local address and serves SSH sessions as a "host_type"
+    host (see HOST_TYPES). "credentials" maps usernames to lists of passwords
+    that are accepted, in the same format as SlaveAPI's "ssh" credentials.
+    With the default port of 0, any free port is used. Giving each server its
+    own loopback address (127.0.0.2, 127.0.0.3, ...) keeps them apart in
+    SlaveAPI's per-host connection pool and facts.
+
+    "connections", "auth_attempts", "pty_requests" and "commands" record what
+    clients did."""
+    def __init__(self, host_type, credentials, address="127.0.0.1", port=0):
+        self.host_type = host_type
+        self.credentials = credentials
+        self.host_key = paramiko.RSAKey.generate(1024)
+        self.listener = socket.socket()
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((address, port))
+        self.listener.listen(100)
+        self.address, self.port = self.listener.getsockname()
+        self.connections = 0
+        self.auth_attempts = 0
+        self.pty_requests = 0
+        self.commands = []
+
+    def spawn(self, target, *args):
+        t = threading.Thread(target=target, args=args)
+        t.daemon = True
+        t.start()
+
+    def start(self):
+        self.spawn(self.serve_forever)
+        return self
+
+    def serve_forever(self):
+        while True:
+            conn, _ = self.listener.accept()
+            self.connections += 1
+            transport = paramiko.Transport(conn)
+            transport.add_server_key(self.host_key)
+            transport.start_server(server=Server(self))
+
+    def serve_exec(self, channel, command):
+        self.commands.append(command)
+        canned = HOST_TYPES[self.host_type]["commands"]
+        if command.strip() in canned:
+            rc, output = canned[command.strip()]
+            if output:
+                channel.sendall(output + "\n")
+        else:
+            rc = self._stream(channel, command, "\n")
+        try:
+            channel.send_exit_status(rc)
+        finally:
+            channel.close()
+
+    def _stream(self, channel, command, eol):
+        """Runs "command" with the local /bin/sh, and sends its output as it
+        is written, so that long running commands like "tail -F" behave as
+        they would on a real host. Returns the command's exit status."""
+        proc = subprocess.Popen(["/bin/sh", "-c", command], stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT)
+        self.spawn(self._kill_when_closed, channel, proc)
+        fd = proc.stdout.fileno()
+        make_nonblocking(fd)
+        try:
+            while True:
+                data = nb_read(fd, 65536)
+                if not data:
+                    break
+                channel.sendall(data.replace("\n", eol))
+        except socket.error:
+            proc.kill()
+        rc = proc.wait()
+        # Like a shell would, report being killed by a signal as 128 + signal.
+        return 128 - rc if rc < 0 else rc
+
+    def _kill_when_closed(self, channel, proc):
+        while proc.poll() is None:
+            if channel.closed:
+                proc.kill()
+                return
+            time.sleep(0.1)
+
+    def serve_shell(self, channel):
+        canned = HOST_TYPES[self.host_type]["commands"]
+        time.sleep(HOST_TYPES[self.host_type]["shell_delay"])
+        prompt = HOST_TYPES[self.host_type]["prompt"]
+        channel.sendall(prompt)
+        rc = 0
+        data = ""
+        while True:
+            chunk = channel.recv(1024)
+            if not chunk:
+                break
+            data += chunk
+            while "\n" in data:
+                line, data = data.split("\n", 1)
+                line = line.rstrip("\r")
+                # Echo the input back, like a pty would.
+                channel.sendall(line + "\r\n")
+                if not line:
+                    channel.sendall(prompt)
+                    continue
+                self.commands.append(line)
+                if line == "echo $?":
+                    output = str(rc)
+                elif line.startswith("echo ") and "$" not in line:
+                    output = line[len("echo "):]
+                elif line == "exit":
+                    channel.close()
+                    return
+                elif line.strip() in canned:
+                    rc, output = canned[line.strip()]
+                else:
+                    rc = self._stream(channel, line, "\r\n")
+                    output = None
+                if output:
+                    channel.sendall(output.replace("\n", "\r\n") + "\r\n")
+                channel.sendall(prompt)
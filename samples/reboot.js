@@ -1,16 +1,21 @@
 var SLAVEAPI = "http://cruncher.srv.releng.scl3.mozilla.com:8000";
 
-function poll_for_success(requestid, slave) {
+// Result states, see slaveapi/actions/results.py
+var PENDING = 0, RUNNING = 1;
+
+function poll_for_success(requestid, slave, state) {
     var resultsElement = $("#results");
-    var url = SLAVEAPI + "/slaves/" + slave + "/actions/reboot" + "?requestid=" + requestid;
+    // The server holds on to this request until the state of the reboot
+    // changes (or 60 seconds pass), so we can ask again right away.
+    var url = SLAVEAPI + "/slaves/" + slave + "/actions/reboot" + "?requestid=" + requestid + "&wait=60&state=" + state;
     $.ajax(url, {"type": "get"})
     .done(function(data) {
-        if (data["state"] != "pending") {
+        if (data["state"] != PENDING && data["state"] != RUNNING) {
             newText = slave + " - Reboot is " + data["text"];
         }
         else {
             newText = slave + " - Reboot is still pending";
-            setTimeout(poll_for_success, 15000, requestid, slave);
+            poll_for_success(requestid, slave, data["state"]);
         }
         resultsElement.text(newText);
     });
@@ -24,6 +29,6 @@ function reboot(slave) {
         alert("Got failure " + response.status + ": " + response.responseText);
     })
     .done(function(data) {
-        setTimeout(poll_for_success, 15000, data["requestid"], slave);
+        poll_for_success(data["requestid"], slave, data["state"]);
     });
 }
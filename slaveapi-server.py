@@ -38,8 +38,10 @@ import daemon
 from daemon.daemon import get_maximum_file_descriptors
 
 from slaveapi.global_state import bugzilla_client, config, processor, messenger
-from slaveapi.global_state import semaphores, log_data
+from slaveapi.global_state import semaphores, log_data, results, journal, ssh_pool, facts, dns_cache
+from slaveapi.global_state import ipmi_cache
 from slaveapi.web import app
+from slaveapi.slave import info_cache
 from slaveapi.util import logException
 
 log = logging.getLogger(__name__)
@@ -55,8 +57,21 @@ def slashify(url):
         url += "/"
     return url
 
+def get_optional(ini, section, option, default, getter="get"):
+    """Returns an option that may be missing from the config file, falling
+    back to "default" if it is."""
+    if not ini.has_option(section, option):
+        return default
+    return getattr(ini, getter)(section, option)
+
 def load_config(ini):
     config["concurrency"] = ini.getint("server", "concurrency")
+    config["max_jobs_per_worker"] = get_optional(ini, "server", "max_jobs_per_worker", None, "getint")
+    config["reserved_for_interactive"] = get_optional(ini, "server", "reserved_for_interactive", 1, "getint")
+    config["concurrency_shares"] = {}
+    if ini.has_section("concurrency_shares"):
+        for cls in ini.options("concurrency_shares"):
+            config["concurrency_shares"][cls] = ini.getfloat("concurrency_shares", cls)
     # Trailing slashes are important on URLs because urljoin sucks.
     config["slavealloc_api_url"] = slashify(ini.get("slavealloc", "api_url"))
     config["inventory_api_url"] = slashify(ini.get("inventory", "api_url"))
@@ -70,6 +85,26 @@ def load_config(ini):
     config['aws_secrets'] = ini.get("aws", "aws_secrets")
     config['aws_ssh_key'] = ini.get("aws", "aws_ssh_key")
     config['cloud_tools_path'] = ini.get("aws", "cloud_tools_path")
+    config["results_max_entries"] = get_optional(ini, "results", "max_entries", 10000, "getint")
+    config["results_ttl"] = get_optional(ini, "results", "ttl", 60 * 60 * 24, "getint")
+    config["ssh_idle_timeout"] = get_optional(ini, "ssh", "idle_timeout", 300, "getint")
+    config["ssh_max_per_host"] = get_optional(ini, "ssh", "max_connections_per_host", 4, "getint")
+    config["ssh_max_output_size"] = get_optional(ini, "ssh", "max_output_size", 1024*1024, "getint")
+    config["facts_ttl"] = get_optional(ini, "facts", "ttl", 60 * 60 * 24, "getint")
+    config["dns_negative_ttl"] = get_optional(ini, "dns", "negative_ttl", 60, "getint")
+    config["dns_max_ttl"] = get_optional(ini, "dns", "max_ttl", 60 * 60, "getint")
+    config["ipmi_positive_ttl"] = get_optional(ini, "ipmi", "positive_ttl", 60 * 60 * 24, "getint")
+    config["ipmi_negative_ttl"] = get_optional(ini, "ipmi", "negative_ttl", 60 * 60, "getint")
+    config["load_timeouts"] = {}
+    if ini.has_section("load_timeouts"):
+        for source in ini.options("load_timeouts"):
+            config["load_timeouts"][source] = ini.getint("load_timeouts", source)
+    config["slave_cache_ttls"] = {}
+    if ini.has_section("slave_cache"):
+        for source in ini.options("slave_cache"):
+            config["slave_cache_ttls"][source] = ini.getint("slave_cache", source)
+    config["journal_path"] = get_optional(ini, "journal", "path", None)
+    config["journal_sync_interval"] = get_optional(ini, "journal", "sync_interval", 1, "getfloat")
 
 def load_credentials(credentials):
     config["ssh_credentials"] = credentials["ssh"]
@@ -139,8 +174,23 @@ def run(config_file):
             config["bugzilla_username"],
             config["bugzilla_password"],
         )
-        processor.configure(config["concurrency"])
-        gevent.spawn(messenger)
+        results.configure(config["results_max_entries"], config["results_ttl"])
+        ssh_pool.configure(config["ssh_idle_timeout"], config["ssh_max_per_host"])
+        facts.configure(config["facts_ttl"])
+        dns_cache.configure(config["dns_negative_ttl"], config["dns_max_ttl"])
+        ipmi_cache.configure(config["ipmi_positive_ttl"], config["ipmi_negative_ttl"])
+        info_cache.configure(config["slave_cache_ttls"])
+        processor.configure(config["concurrency"], config["concurrency_shares"],
+                            config["max_jobs_per_worker"], config["reserved_for_interactive"])
+        # The journal can only be opened once, it's up to a restart to pick
+        # up a new path.
+        if config["journal_path"] and not journal.opened:
+            log.info("Restoring work from %s", config["journal_path"])
+            entries = journal.open(config["journal_path"], results, config["journal_sync_interval"])
+            processor.restore(entries)
+            # Only keep what the result store kept.
+            journal.compact()
+        messenger.start()
 
         if not listener or (listen, port) != listener.getsockname():
             if listener and server:
@@ -166,6 +216,7 @@ def run(config_file):
             sighup_event.wait()
         except KeyboardInterrupt:
             break
+    journal.close()
     log.info("pid %i exited normally", os.getpid())
 
 
@@ -0,0 +1,7 @@
+from importlib import import_module
+
+
+def get_action(name):
+    """Returns the action function called "name". Every action lives in a
+    module of the same name in this package."""
+    return getattr(import_module(".%s" % name, __name__), name)
@@ -8,8 +8,8 @@ from datetime import datetime
 from .results import SUCCESS, FAILURE
 from ..clients.ping import ping
 from ..clients.ssh import RemoteCommandError
+from ..probe import probe
 from ..slave import Slave, get_console
-from ..actions.buildslave_uptime import buildslave_uptime
 
 import logging
 log = logging.getLogger(__name__)
@@ -25,32 +25,30 @@ def buildslave_last_activity(name):
     }
     """
     slave = Slave(name)
-    slave.load_slavealloc_info()
 
-    rc, uptime = buildslave_uptime(name)
-    if rc != SUCCESS:
-        return rc, uptime
-    cur_time = time.time()
-
-    if uptime < 3 * 60:
-        # Assume we're still booting
-        log.debug("uptime is %.2f; assuming we're still booting up", uptime)
-        return SUCCESS, { "state": "booting", "last_activity": 0 }
+    if not ping(slave.fqdn):
+        return FAILURE, "%s - Slave is offline, cannot get uptime!" % name
 
-    console = get_console(slave, usebuildbotslave=False)
+    # Uptime and the twistd.log tail are found out together, in one go.
+    console = get_console(slave, usebuildbotslave=True)
     try:
-        log.debug("tailing twistd.log")
+        log.debug("probing slave")
         log.debug("slave.basedir='%s'" % slave.basedir)
-        # we'll disregard the return code b/c it will be non-zero if twistd.log.1 is not found
-        rc, output = console.run_cmd("tail -n 100 %(basedir)s/twistd.log.1 %(basedir)s/twistd.log" % { 'basedir': slave.basedir })
+        info = probe(console, slave.basedir)
     except RemoteCommandError:
         return FAILURE, "failed to tail twistd.log"
-    console.disconnect()
+    if info["uptime"] is None:
+        return FAILURE, "%s - could not retrieve uptime" % name
+    output = info["twistd_log"]
 
-    # account for the time it took to retrieve the log tail
-    # and reset cur_time
-    uptime = uptime + int(time.time() - cur_time)
+    # account for the time it took to retrieve everything
     cur_time = time.time()
+    uptime = int(cur_time - info["boot_time"])
+
+    if uptime < 3 * 60:
+        # Assume we're still booting
+        log.debug("uptime is %.2f; assuming we're still booting up", uptime)
+        return SUCCESS, { "state": "booting", "last_activity": 0 }
 
     last_activity = None
     running_command = False
@@ -1,7 +1,7 @@
 import logging
 
 from ..clients import slavealloc
-from ..slave import Slave
+from ..slave import Slave, info_cache
 from .reboot import reboot
 from .shutdown_buildslave import shutdown_buildslave
 from .results import SUCCESS
@@ -38,8 +38,8 @@ def disable(name, reason=None, force=False):
     return_code = SUCCESS  # innocent until proven guilty!
 
     slave = Slave(name)
-    slave.load_slavealloc_info()
-    slave.load_bug_info(createIfMissing=True)
+    # What's cached may be out of date, eg, if someone changed it by hand.
+    slave.load_slavealloc_info(fresh=True)
 
     if not slave.enabled:  # slave disabled in slavealloc, nothing to do!
         status_msgs.append("Slave is already disabled. Nothing to do.")
@@ -53,6 +53,7 @@ def disable(name, reason=None, force=False):
         api=config["slavealloc_api_url"], name=name,
         data=slavealloc_values,
     )
+    info_cache.invalidate(slave.name, "slavealloc")
     status_msgs.append(str(update_alloc_msg))
     ####
 
@@ -76,10 +77,12 @@ def disable(name, reason=None, force=False):
     else:
         status_msgs.append("%s - Couldn't be confirmed disabled via slaveapi" % name)
 
+    slave.load_bug_info(createIfMissing=True, fresh=True)
     bug_data = {}
     if not slave.bug.data["is_open"]:
         bug_data["status"] = "REOPENED"
     slave.bug.add_comment("\n".join(status_msgs), data=bug_data)
+    info_cache.invalidate(slave.name, "bug")
     ###
 
     return return_code, "\n".join(status_msgs)
@@ -1,8 +1,9 @@
 from .results import SUCCESS, FAILURE
 from ..clients.bugzilla import file_reboot_bug
 from ..clients.ping import ping
+from ..global_state import ipmi_cache
 from ..machines.base import wait_for_reboot
-from ..slave import Slave, get_console
+from ..slave import Slave, get_console, info_cache
 from ..util import logException
 
 import logging
@@ -28,10 +29,9 @@ def reboot(name, update_bug=True):
         the appropriate bugs.
     """
     status_text = ""
+    # Inventory (for the PDU), IPMI and bugs are only looked up if they're
+    # needed, which they aren't when an SSH reboot works.
     slave = Slave(name)
-    slave.load_inventory_info()
-    slave.load_ipmi_info()
-    slave.load_bug_info(createIfMissing=False)
     status_text += "Attempting SSH reboot..."
 
     alive = False
@@ -63,7 +63,8 @@ def reboot(name, update_bug=True):
                 slave.ipmi.powercycle()
             except:
                 logException(log.warning, "Eating exception during IPMI reboot.")
-                pass
+                # Find out whether it still works next time.
+                ipmi_cache.invalidate(slave.ipmi.fqdn)
             alive = wait_for_reboot(slave)
         except:
             logException(log.error, "Caught exception during IPMI reboot.")
@@ -89,6 +90,9 @@ def reboot(name, update_bug=True):
         return SUCCESS, status_text
     else:
         status_text += "Failed.\n"
+        # Make sure we don't file a second reboot bug because the cache
+        # doesn't know about one that was filed recently.
+        slave.load_bug_info(fresh=True)
         if slave.reboot_bug:
             status_text += "Slave already has reboot bug (%s), nothing to do." % slave.reboot_bug.id_
             return FAILURE, status_text
@@ -102,4 +106,5 @@ def reboot(name, update_bug=True):
                 if not slave.bug.data["is_open"]:
                     data["status"] = "REOPENED"
                 slave.bug.add_comment(status_text, data=data)
+                info_cache.invalidate(slave.name, "bug")
             return FAILURE, status_text
@@ -1,4 +1,6 @@
-from collections import defaultdict
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict, OrderedDict
+from itertools import count
 
 from gevent.event import Event
 
@@ -6,13 +8,22 @@ import time
 
 PENDING, RUNNING, SUCCESS, FAILURE = range(4)
 
+# Requestids used to be id(self), but now that finished results are evicted
+# from the ResultStore their memory can be reused, which would hand out
+# duplicate requestids. Seeding from the clock keeps them unique across
+# restarts too.
+_requestids = count(int(time.time() * 1000))
+
 class ActionResult(object):
     """Contains basic information about the result of a specific Action."""
     def __init__(self, slave, action, state=PENDING,
                  request_timestamp=0,
                  start_timestamp=0,
-                 finish_timestamp=0):
-        self.id_ = id(self)
+                 finish_timestamp=0,
+                 requestid=None):
+        if requestid is None:
+            requestid = next(_requestids)
+        self.id_ = requestid
         self.slave = slave
         self.action = action
         self._state = state
@@ -23,6 +34,8 @@ class ActionResult(object):
         self._start_timestamp = start_timestamp
         self._finish_timestamp = finish_timestamp
         self.event = Event()
+        # Set (and replaced) whenever the state changes.
+        self._changed = Event()
 
     @property
     def state(self):
@@ -35,6 +48,8 @@ class ActionResult(object):
         self._state = state
         if state in (SUCCESS, FAILURE):
             self.event.set()
+        changed, self._changed = self._changed, Event()
+        changed.set()
 
     @property
     def text(self):
@@ -68,6 +83,19 @@ class ActionResult(object):
     def finish_timestamp(self, timestamp):
         self._finish_timestamp = timestamp
 
+    def transition(self, state, text, start_timestamp=None, finish_timestamp=None):
+        """Moves this result to "state", updating its text and any timestamps
+        that are passed at the same time. Returns the event describing the
+        transition (see to_event)."""
+        self._text = text
+        if start_timestamp is not None:
+            self._start_timestamp = start_timestamp
+        if finish_timestamp is not None:
+            self._finish_timestamp = finish_timestamp
+        # Set the state last, because it wakes up anyone waiting on us.
+        self.state = state
+        return self.to_event()
+
     def is_done(self):
         if self.event.isSet():
             return True
@@ -97,13 +125,262 @@ class ActionResult(object):
             data["requestid"] = self.id_
         return data
 
+    @property
+    def last_update(self):
+        """The time of the most recent state change."""
+        return max(self._request_timestamp, self._start_timestamp,
+                   self._finish_timestamp)
+
+    def to_event(self):
+        """Returns the same data as to_dict (including "requestid") as well
+        as the "slave" and "action" this result is for."""
+        data = self.to_dict(include_requestid=True)
+        data["slave"] = self.slave
+        data["action"] = self.action
+        return data
+
     def wait(self, timeout=None):
         return self.event.wait(timeout)
 
+    def wait_for_change(self, state, timeout=None):
+        """Waits up to "timeout" seconds for this result to leave "state".
+        Returns True if it has."""
+        if self._state == state:
+            self._changed.wait(timeout)
+        return self._state != state
+
+
+class ResultStore(object):
+    """Holds ActionResults, indexed by requestid and by slave and action.
+    Finished results are evicted once they have been finished for more than
+    "ttl" seconds, or in least recently used order once more than
+    "max_entries" results are being held. Pending and running results are
+    never evicted. Lookups never create entries.
+
+    The store finds out about results finishing through record_events, which
+    must be subscribed to the :py:class:`slaveapi.messenger.Messenger`."""
+    # How often (in seconds) to sweep the finished results for expired ones.
+    expire_interval = 60
+
+    def __init__(self, max_entries=10000, ttl=60 * 60 * 24):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # requestid -> ActionResult
+        self._results = {}
+        # requestid -> ActionResult for finished results only, in least
+        # recently used order. Keeping these apart means that eviction never
+        # has to walk over pending or running results.
+        self._finished = OrderedDict()
+        # (slave, action) -> {requestid: ActionResult}
+        self._index = {}
+        # Sorted requestids, for paging through results in a stable order.
+        self._ids = []
+        # slave -> sorted requestids of its results
+        self._slave_ids = {}
+        self._last_expire = 0
+
+    def configure(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._prune()
+
+    def add(self, res):
+        self._results[res.id_] = res
+        if res.is_done():
+            self._finished[res.id_] = res
+        for ids in (self._ids, self._slave_ids.setdefault(res.slave, [])):
+            if not ids or res.id_ > ids[-1]:
+                ids.append(res.id_)
+            else:
+                insort(ids, res.id_)
+        self._index.setdefault((res.slave, res.action), {})[res.id_] = res
+        self._prune()
+
+    def record_events(self, events):
+        """Takes note of results that have finished, from a batch of
+        ActionResult transition events."""
+        for event in events:
+            requestid = event["requestid"]
+            if (event["state"] in (SUCCESS, FAILURE) and
+                    requestid in self._results and
+                    requestid not in self._finished):
+                self._finished[requestid] = self._results[requestid]
+        self._prune()
+
+    def get(self, slave, action, requestid):
+        """Returns the ActionResult for "requestid" if it exists and belongs
+        to "slave" and "action", otherwise None."""
+        res = self._results.get(requestid, None)
+        if res is None or res.slave != slave or res.action != action:
+            return None
+        # Mark this result as the most recently used one.
+        if requestid in self._finished:
+            self._finished[requestid] = self._finished.pop(requestid)
+        return res
+
+    def find(self, requestid):
+        """Returns the ActionResult for "requestid" regardless of which slave
+        or action it is for, or None if there isn't one."""
+        return self._results.get(requestid, None)
+
+    def get_action_results(self, slave, action):
+        """Returns a dict of requestid -> ActionResult for all of the results
+        held for "slave" and "action"."""
+        return dict(self._index.get((slave, action), {}))
+
+    def remove(self, requestid):
+        res = self._results.pop(requestid, None)
+        if res is None:
+            return
+        self._finished.pop(requestid, None)
+        del self._ids[bisect_left(self._ids, requestid)]
+        slave_ids = self._slave_ids[res.slave]
+        del slave_ids[bisect_left(slave_ids, requestid)]
+        if not slave_ids:
+            del self._slave_ids[res.slave]
+        key = (res.slave, res.action)
+        action_results = self._index[key]
+        del action_results[requestid]
+        if not action_results:
+            del self._index[key]
+
+    def select(self, after=None, limit=None, predicate=None, slave=None, max_scan=None):
+        """Returns a list of up to "limit" ActionResults in requestid order,
+        starting with the first requestid greater than "after", and the
+        requestid to pass as "after" to carry on from where it left off (or
+        None if there's nothing left). If "slave" is passed, only that
+        slave's results are looked at. If "predicate" is passed, only results
+        that it returns True for are included.
+
+        If "max_scan" is passed, at most that many results are looked at, so
+        that the cost of a selection doesn't depend on how many results are
+        held. Fewer than "limit" (even no) results may be returned then, with
+        a requestid to carry on from."""
+        ids = self._ids
+        if slave is not None:
+            ids = self._slave_ids.get(slave, [])
+        selected = []
+        start = 0
+        if after is not None:
+            start = bisect_right(ids, after)
+        end = len(ids)
+        if max_scan is not None:
+            end = min(end, start + max_scan)
+        for i in xrange(start, end):
+            res = self._results[ids[i]]
+            if predicate is None or predicate(res):
+                selected.append(res)
+                if limit is not None and len(selected) >= limit:
+                    end = i + 1
+                    break
+        if end < len(ids):
+            return selected, ids[end - 1]
+        return selected, None
+
+    def __iter__(self):
+        return self._results.itervalues()
+
+    def __len__(self):
+        return len(self._results)
+
+    def _prune(self):
+        now = time.time()
+        if now - self._last_expire >= self.expire_interval:
+            self._last_expire = now
+            expired = [requestid for requestid, res in self._finished.iteritems()
+                       if now - res.finish_timestamp > self.ttl]
+            for requestid in expired:
+                self.remove(requestid)
+
+        while len(self._results) > self.max_entries and self._finished:
+            requestid, _ = self._finished.popitem(last=False)
+            self.remove(requestid)
+
+
+class Batch(object):
+    """Tracks the ActionResults of an action that was requested for many
+    slaves at once."""
+    def __init__(self, action):
+        self.id_ = next(_requestids)
+        self.action = action
+        self.request_timestamp = time.time()
+        # slave -> ActionResult
+        self.results = {}
+        # Slaves that were asked for more than once, in the order they were
+        # first repeated.
+        self.duplicates = []
+
+    def add(self, res):
+        self.results[res.slave] = res
+
+    def add_duplicate(self, slave):
+        if slave not in self.duplicates:
+            self.duplicates.append(slave)
+
+    def counts(self):
+        """Returns the number of results in each state, and in total."""
+        counts = {"pending": 0, "running": 0, "success": 0, "failure": 0}
+        names = {PENDING: "pending", RUNNING: "running", SUCCESS: "success",
+                 FAILURE: "failure"}
+        for res in self.results.itervalues():
+            counts[names[res.state]] += 1
+        counts["total"] = len(self.results)
+        return counts
+
+    def to_dict(self):
+        """Returns the progress of this Batch in a dict. "requestids" maps
+        each slave to the requestid of its action, and "duplicates" lists the
+        slaves that were asked for more than once. Example:
+
+        .. code-block:: python
+
+            {
+                "batchid": 1392414314123,
+                "action": "reboot",
+                "request_timestamp": 1392414314,
+                "counts": {
+                    "pending": 1,
+                    "running": 1,
+                    "success": 0,
+                    "failure": 0,
+                    "total": 2
+                },
+                "requestids": {
+                    "linux-ix-slave04": 1392414314124,
+                    "w64-ix-slave05": 1392414314125
+                },
+                "duplicates": []
+            }
+        """
+        return {
+            "batchid": self.id_,
+            "action": self.action,
+            "request_timestamp": self.request_timestamp,
+            "counts": self.counts(),
+            "requestids": dict((slave, res.id_) for slave, res
+                               in self.results.iteritems()),
+            "duplicates": self.duplicates,
+        }
+
+
+class BatchStore(object):
+    """Holds the most recently requested Batches."""
+    def __init__(self, max_entries=100):
+        self.max_entries = max_entries
+        self._batches = OrderedDict()
+
+    def add(self, batch):
+        self._batches[batch.id_] = batch
+        while len(self._batches) > self.max_entries:
+            self._batches.popitem(last=False)
+
+    def get(self, batchid):
+        return self._batches.get(batchid, None)
+
 
 def dictify_results(results):
-    """Returns a dict of ActionResults broken down by slave, action, and
-    requestid. Specific results are processed by
+    """Returns a dict of ActionResults (such as the contents of a ResultStore)
+    broken down by slave, action, and requestid. Specific results are processed by
     :py:func:`slaveapi.actions.results.ActionResults.to_dict`. Example:
 
     .. code-block:: python
@@ -134,8 +411,6 @@ def dictify_results(results):
         }
     """
     ret = defaultdict(lambda: defaultdict(dict))
-    for slave in results:
-        for action in results[slave]:
-            for requestid, result in results[slave][action].iteritems():
-                ret[slave][action][requestid] = result.to_dict()
+    for result in results:
+        ret[result.slave][result.action][result.id_] = result.to_dict()
     return ret
@@ -13,6 +13,10 @@ log = logging.getLogger(__name__)
 
 # The longest we will wait for a slave to shutdown.
 MAX_SHUTDOWN_WAIT_TIME = 60 * 60 * 5 # 5 hours
+# How long to wait before reconnecting after losing the connection we're
+# watching twistd.log through. This doubles with every failed attempt.
+MIN_RECONNECT_WAIT = 5
+MAX_RECONNECT_WAIT = 60 * 5
 
 def shutdown_buildslave(name):
     """Attempts to gracefully shut down the buildslave process on the named
@@ -22,7 +26,6 @@ def shutdown_buildslave(name):
     the shutdown is confirmed by watching the slave's twistd.log file."""
     status_text = "Gracefully shutting down slave..."
     slave = Slave(name)
-    slave.load_slavealloc_info()
 
     if not slave.master_url:
         status_text += "Success\nNo master set, nothing to do!"
@@ -51,18 +54,23 @@ def shutdown_buildslave(name):
     twistd_log = "%s/%s" % (slave.basedir, "twistd.log")
     start = time.time()
     console = get_console(slave, usebuildbotslave=True)
+    reconnect_wait = MIN_RECONNECT_WAIT
     while console and time.time() - start < MAX_SHUTDOWN_WAIT_TIME:
+        followed = time.time()
         try:
-            rc, output = console.run_cmd("tail -n1 %s" % twistd_log)
-            if "Server Shut Down" in output:
+            line = console.follow(twistd_log, ["Server Shut Down"],
+                                  MAX_SHUTDOWN_WAIT_TIME - (followed - start))
+            if line:
                 status_text += "Success"
                 log.debug("Shutdown succeeded.")
                 return SUCCESS, status_text
-            else:
-                time.sleep(30)
         except RemoteCommandError:
-            logException(log.debug, "Caught error when waiting for shutdown, trying again...")
-            time.sleep(30)
+            # Only back off further if the connection didn't last.
+            if time.time() - followed > reconnect_wait:
+                reconnect_wait = MIN_RECONNECT_WAIT
+            logException(log.debug, "Caught error when waiting for shutdown, trying again in %d seconds..." % reconnect_wait)
+            time.sleep(reconnect_wait)
+            reconnect_wait = min(reconnect_wait * 2, MAX_RECONNECT_WAIT)
     else:
         status_text += "Failure\nCouldn't confirm shutdown"
         return FAILURE, status_text
@@ -0,0 +1,43 @@
+import time
+
+from dns import resolver
+
+from ..util.cache import TTLCache
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class DNSCache(TTLCache):
+    """Caches DNS answers for as long as their TTLs say they're good (but no
+    longer than "max_ttl" seconds), and names that don't exist (NXDOMAIN) for
+    "negative_ttl" seconds. Concurrent lookups of a name that isn't cached
+    share a single query."""
+
+    def __init__(self, negative_ttl=60, max_ttl=60 * 60):
+        TTLCache.__init__(self)
+        self.negative_ttl = negative_ttl
+        self.max_ttl = max_ttl
+
+    def configure(self, negative_ttl, max_ttl):
+        self.negative_ttl = negative_ttl
+        self.max_ttl = max_ttl
+
+    def query(self, name, rdtype="A"):
+        """Like dns.resolver.query, but cached. Raises dns.resolver.NXDOMAIN
+        if "name" doesn't exist."""
+        def fetch():
+            try:
+                return resolver.query(name, rdtype)
+            except resolver.NXDOMAIN, e:
+                # Other failures (timeouts, etc.) aren't worth remembering.
+                return e
+        answer = self.get_or_fetch((name.lower().rstrip("."), rdtype), fetch, self._ttl)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    def _ttl(self, answer):
+        if isinstance(answer, Exception):
+            return self.negative_ttl
+        return min(answer.expiration - time.time(), self.max_ttl)
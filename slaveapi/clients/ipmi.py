@@ -1,6 +1,8 @@
 from subprocess import check_output, CalledProcessError, STDOUT
 import time
 
+from ..util.cache import TTLCache
+
 import logging
 log = logging.getLogger(__name__)
 
@@ -88,3 +90,47 @@ class IPMIInterface(object):
                 log.debug("Return code was %d, output was:", e.returncode)
                 log.debug(e.output)
                 raise
+
+
+class IPMICapabilityCache(TTLCache):
+    """Remembers which management hosts have a working IPMI interface, so
+    that finding out doesn't take an "mc info" probe (and its retries) every
+    time. Working interfaces are trusted for "positive_ttl" seconds and
+    broken or missing ones for "negative_ttl" seconds. Once an answer is past
+    half of its TTL, it is still used, but is also verified again in the
+    background, so that hosts that are looked up regularly never wait for a
+    probe. Concurrent probes of the same host are shared."""
+    # How far into its TTL an answer gets re-verified in the background.
+    reverify_after = 0.5
+
+    def __init__(self, positive_ttl=60 * 60 * 24, negative_ttl=60 * 60):
+        TTLCache.__init__(self)
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+
+    def configure(self, positive_ttl, negative_ttl):
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+
+    def get_interface(self, fqdn, username, password):
+        """Like IPMIInterface.get_if_exists, but only probes "fqdn" if what
+        we know about it has expired. Failing to run ipmitool at all says
+        nothing about the host, so that isn't remembered."""
+        def probe():
+            works = IPMIInterface.get_if_exists(fqdn, username, password) is not None
+            log.debug("IPMI on %s %s", fqdn, "works" if works else "doesn't work")
+            return works
+        works = self.get_or_fetch(fqdn, probe, self._ttl, refresh_after=self.reverify_after)
+        if works:
+            return IPMIInterface(fqdn, username, password)
+        return None
+
+    def invalidate(self, fqdn):
+        """Forgets what we know about "fqdn", eg, after its IPMI interface
+        failed to do something."""
+        self.forget(fqdn)
+
+    def _ttl(self, works):
+        if works:
+            return self.positive_ttl
+        return self.negative_ttl
@@ -1,11 +1,20 @@
+from collections import defaultdict, deque
 import re
 import time
 import socket
+from uuid import uuid4
 
+from gevent import sleep, spawn
+from gevent.event import Event
+try:
+    from gevent.lock import BoundedSemaphore
+except ImportError:
+    from gevent.coros import BoundedSemaphore
 from paramiko import SSHClient, AuthenticationException, SSHException
 
 import logging
 
+from ..facts import HostFacts
 from ..util import logException
 log = logging.getLogger(__name__)
 
@@ -22,6 +31,282 @@ class IgnorePolicy(object):
         pass
 
 
+class SSHConnectionPool(object):
+    """Keeps logged in SSH connections around after use, so that running
+    several commands against the same host doesn't cost a full connect and
+    login each time. Idle connections are kept per (host, username), and are
+    closed once they've been idle for "idle_timeout" seconds or are found to
+    be dead. At most "max_per_host" connections (idle or in use) are open to
+    any one host at a time."""
+    # How often (in seconds) to look for connections that have been idle for
+    # too long.
+    reap_interval = 30
+
+    def __init__(self, idle_timeout=300, max_per_host=4):
+        self.idle_timeout = idle_timeout
+        self.max_per_host = max_per_host
+        # (host, username) -> list of (SSHClient, time it was checked in)
+        self._idle = defaultdict(list)
+        # host -> BoundedSemaphore with a slot for every open connection
+        self._slots = {}
+        # host -> Events of callers waiting in checkout(), in order
+        self._waiters = defaultdict(deque)
+        self._reaper = None
+
+    def configure(self, idle_timeout, max_per_host):
+        self.idle_timeout = idle_timeout
+        # Only hosts that we haven't talked to yet get the new limit.
+        self.max_per_host = max_per_host
+
+    def checkout(self, host, usernames, timeout=None):
+        """Returns a (client, username) tuple for a healthy idle connection
+        to "host" as one of "usernames" (tried in order). If there aren't
+        any, a slot for a new connection is reserved and None is returned.
+        When "host" already has as many connections as it's allowed, an idle
+        connection as another user is closed to make room, or we wait up to
+        "timeout" seconds (behind anyone else who is already waiting) for a
+        connection to be checked in or closed. Returns False if that doesn't
+        happen in time."""
+        deadline = None if timeout is None else time.time() + timeout
+        waiters = self._waiters[host]
+        if not waiters:
+            pooled = self._try_checkout(host, usernames)
+            if pooled is not False:
+                return pooled
+        waiter = Event()
+        waiters.append(waiter)
+        try:
+            while True:
+                remaining = None if deadline is None else max(deadline - time.time(), 0)
+                if not waiter.wait(remaining):
+                    return False
+                waiter.clear()
+                pooled = self._try_checkout(host, usernames)
+                if pooled is not False:
+                    return pooled
+        finally:
+            waiters.remove(waiter)
+
+    def _try_checkout(self, host, usernames):
+        """Like checkout(), but returns False instead of waiting."""
+        slots = self._slots.get(host)
+        if not slots:
+            slots = self._slots[host] = BoundedSemaphore(self.max_per_host)
+        while True:
+            pooled = self._checkout_idle(host, usernames)
+            if pooled:
+                return pooled
+            if slots.acquire(blocking=False):
+                return None
+            if not self._close_one_idle(host):
+                return False
+
+    def _checkout_idle(self, host, usernames):
+        for username in usernames:
+            idle = self._idle.get((host, username))
+            while idle:
+                client, _ = idle.pop()
+                transport = client.get_transport()
+                if transport and transport.is_active():
+                    log.debug("Reusing connection as %s", username)
+                    return client, username
+                log.debug("Discarding dead connection as %s", username)
+                self.close(host, client)
+        return None
+
+    def release(self, host):
+        """Releases a slot that was reserved by checkout(), without checking
+        a connection in."""
+        self._slots[host].release()
+        self._notify(host)
+
+    def _notify(self, host):
+        """Wakes up the first caller waiting in checkout() for "host" that
+        hasn't already been woken up."""
+        for waiter in self._waiters.get(host, ()):
+            if not waiter.is_set():
+                waiter.set()
+                return
+
+    def checkin(self, host, username, client):
+        self._idle[(host, username)].append((client, time.time()))
+        self._notify(host)
+        if not self._reaper:
+            self._reaper = spawn(self._reap)
+
+    def close(self, host, client):
+        """Closes a connection that was checked out or opened after
+        checkout() reserved a slot, and releases its slot."""
+        try:
+            client.close()
+        finally:
+            self.release(host)
+
+    def discard(self, host):
+        """Closes all idle connections to "host", eg, because it is going
+        down."""
+        for (idle_host, username), idle in self._idle.items():
+            if idle_host == host:
+                while idle:
+                    client, _ = idle.pop()
+                    self.close(host, client)
+
+    def _close_one_idle(self, host):
+        for (idle_host, username), idle in self._idle.iteritems():
+            if idle_host == host and idle:
+                client, _ = idle.pop(0)
+                self.close(host, client)
+                return True
+        return False
+
+    def _reap(self):
+        while True:
+            sleep(self.reap_interval)
+            now = time.time()
+            for (host, username), idle in self._idle.items():
+                for entry in list(idle):
+                    client, checked_in = entry
+                    if now - checked_in > self.idle_timeout:
+                        log.debug("Closing idle connection to %s as %s", host, username)
+                        idle.remove(entry)
+                        self.close(host, client)
+                if not idle:
+                    del self._idle[(host, username)]
+
+
+class OutputBuffer(object):
+    """Collects command output in chunks. Once more than "max_size" bytes
+    have been collected, only the first and last halves of that are kept,
+    with a marker saying how much was dropped in between them."""
+    truncation_marker = "\n[... %d bytes truncated ...]\n"
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self._head = []
+        self._head_size = 0
+        self._tail = deque()
+        self._tail_size = 0
+        self.truncated = 0
+
+    def append(self, data):
+        if self.max_size is None:
+            self._head.append(data)
+            return
+        room = self.max_size // 2 - self._head_size
+        if room > 0:
+            self._head.append(data[:room])
+            self._head_size += len(data[:room])
+            data = data[room:]
+        if not data:
+            return
+        self._tail.append(data)
+        self._tail_size += len(data)
+        excess = self._tail_size - (self.max_size - self.max_size // 2)
+        while excess > 0:
+            first = self._tail[0]
+            if len(first) <= excess:
+                self._tail.popleft()
+                dropped = len(first)
+            else:
+                self._tail[0] = first[excess:]
+                dropped = excess
+            self._tail_size -= dropped
+            self.truncated += dropped
+            excess -= dropped
+
+    def getvalue(self):
+        value = "".join(self._head)
+        if self.truncated:
+            value += self.truncation_marker % self.truncated
+        return value + "".join(self._tail)
+
+
+class ChannelReader(object):
+    """Reads the output of commands from a channel, splitting it up at
+    sentinels that mark the end of each command's output. Only newly read
+    data (plus enough of what came before to catch sentinels that span two
+    reads) is scanned for sentinels, and each command's output is collected
+    in an OutputBuffer of at most "max_size" bytes."""
+    read_size = 32768
+
+    def __init__(self, console, channel, max_size=None):
+        self.console = console
+        self.channel = channel
+        self.max_size = max_size
+        # Data that has been read but not yet handed out.
+        self._pending = ""
+
+    def read_until(self, sentinel, overlap, deadline):
+        """Reads output until the "sentinel" regex matches. "overlap" must
+        be at least as long as anything "sentinel" can match. Returns an
+        OutputBuffer with everything before the sentinel and the match, or
+        everything up until the channel closed and None if the sentinel
+        never showed up. A None "sentinel" reads until the channel closes."""
+        buf = OutputBuffer(self.max_size)
+        while True:
+            match = sentinel and sentinel.search(self._pending)
+            if match:
+                buf.append(self._pending[:match.start()])
+                self._pending = self._pending[match.end():]
+                return buf, match
+            # Hold back the end of what we've scanned in case a sentinel
+            # starts there.
+            keep = overlap if sentinel else 0
+            if len(self._pending) > keep:
+                cut = len(self._pending) - keep
+                buf.append(self._pending[:cut])
+                self._pending = self._pending[cut:]
+            chunk = self.console._recv(self.channel, deadline, self.read_size)
+            if not chunk:
+                buf.append(self._pending)
+                self._pending = ""
+                return buf, None
+            self._pending += chunk
+
+
+def host_pattern(name):
+    """Returns the pattern that "name" shares with similarly named hosts,
+    which is the short hostname with its trailing number replaced, eg:
+    "t-w864-ix-123.wintest.releng.scl3.mozilla.com" -> "t-w864-ix-#"."""
+    return re.sub(r"\d+$", "#", name.split(".")[0])
+
+
+class CredentialCache(object):
+    """Remembers which username and password last worked for each host, and
+    for each host name pattern (see host_pattern()). Hosts of the same type
+    tend to share credentials, so the credentials that worked for one of them
+    are a good first guess for the others. Entries are forgotten as soon as
+    they stop working."""
+
+    def __init__(self):
+        # host -> (username, password)
+        self._hosts = {}
+        # host name pattern -> (username, password)
+        self._patterns = {}
+
+    def preferred(self, host, name=None):
+        """Returns the (username, password) tuples that are worth trying
+        first for "host", most specific first."""
+        preferred = []
+        for cache, key in ((self._hosts, host), (self._patterns, name and host_pattern(name))):
+            creds = cache.get(key)
+            if creds and creds not in preferred:
+                preferred.append(creds)
+        return preferred
+
+    def remember(self, host, name, username, password):
+        self._hosts[host] = (username, password)
+        if name:
+            self._patterns[host_pattern(name)] = (username, password)
+
+    def forget(self, host, name, username, password):
+        """Drops any entries for "host" or its pattern that point at
+        "username" and "password"."""
+        for cache, key in ((self._hosts, host), (self._patterns, name and host_pattern(name))):
+            if cache.get(key) == (username, password):
+                del cache[key]
+
+
 class SSHConsole(object):
     # By trying a few different reboot commands we don't need to special case
     # different types of hosts. The "shutdown" command is for Windows, but uses
@@ -30,141 +315,416 @@ class SSHConsole(object):
     # of the shutdown command.
     reboot_commands = ["reboot", "sudo reboot", "shutdown -f -t 3 -r"]
     # Best guess at the maximum possible width of any shell prompt we encounter.
-    # This needs to be tracked because we run commands through a pty, and if
-    # len(prompt) + len(cmd) is more than the pty width, a newline will show up
-    # in the output partway through the command. This is really far from ideal
-    # but until we can run commands through ssh "exec" instead of a pty, we're
-    # stuck with it.
+    # This needs to be tracked because on hosts that don't support "exec" we
+    # run commands through a pty, and if len(prompt) + len(cmd) is more than
+    # the pty width, a newline will show up in the output partway through the
+    # command.
     max_prompt_size = 100
+    # While following a file, how often (in seconds) to send keepalives, and
+    # how long to go without any output before checking that the connection
+    # is still up.
+    follow_keepalive_interval = 30
+    follow_idle_timeout = 60
+    # How long (in seconds) to wait for a new shell to answer before asking
+    # again whether it's ready. The wait doubles after every unanswered ask.
+    shell_ready_min_wait = 0.25
+    shell_ready_max_wait = 16
 
-    def __init__(self, fqdn, credentials, pty_width=1000):
+    def __init__(self, fqdn, credentials, pty_width=1000, pool=None, name=None, credential_cache=None,
+                 max_output_size=1024*1024, facts=None, port=22):
         self.fqdn = fqdn
+        self.port = port
         self.credentials = credentials
         self.pty_width = pty_width
+        # The most output (in bytes) to keep from any one command. Anything
+        # past that is dropped from the middle of the output.
+        self.max_output_size = max_output_size
+        self.pool = pool
+        # The host's name, if "fqdn" is an IP address. Used to find
+        # credentials that worked for similarly named hosts.
+        self.name = name or fqdn
+        # What we know about the host (see HostFacts), which is kept under
+        # its name. Pass in a shared HostFacts to remember things between
+        # consoles. We keep track of:
+        # * "shell": "pty" if the SSH server doesn't support "exec".
+        # * "shell_startup": how long (in seconds) its last shell took to
+        #   become ready.
+        # * "reboot_command": the index of the reboot command that worked.
+        self.facts = facts if facts is not None else HostFacts()
+        self.credential_cache = credential_cache
         self.connected = False
-        self.client = SSHClient()
-        self.client.set_missing_host_key_policy(IgnorePolicy())
+        self.username = None
+        self.client = None
+
+    def _new_client(self):
+        client = SSHClient()
+        client.set_missing_host_key_policy(IgnorePolicy())
+        return client
 
     def connect(self, usernames=None, timeout=30):
-        last_exc = None
         if usernames:
             possible_credentials = {}
             for u in usernames:
                 possible_credentials[u] = self.credentials[u]
         else:
             possible_credentials = self.credentials
+        if self.pool:
+            usernames = possible_credentials.keys()
+            # Prefer connections as a user that is known to work.
+            for username, _ in reversed(self._preferred_credentials(possible_credentials)):
+                usernames.remove(username)
+                usernames.insert(0, username)
+            pooled = self.pool.checkout(self.fqdn, usernames, timeout=timeout)
+            if pooled is False:
+                raise SSHException("Too many connections to %s" % self.fqdn)
+            if pooled:
+                self.client, self.username = pooled
+                self.connected = True
+                return
+        try:
+            self._login(possible_credentials, timeout)
+        except:
+            if self.pool:
+                self.pool.release(self.fqdn)
+            raise
+
+    def _preferred_credentials(self, possible_credentials):
+        """Returns the cached (username, password) tuples for this host that
+        are still among "possible_credentials"."""
+        if not self.credential_cache:
+            return []
+        return [(u, p) for u, p in self.credential_cache.preferred(self.fqdn, self.name)
+                if p in possible_credentials.get(u, ())]
+
+    def _login(self, possible_credentials, timeout):
+        last_exc = None
+        self.client = self._new_client()
+        preferred = self._preferred_credentials(possible_credentials)
+        attempts = list(preferred)
         for username, passwords in possible_credentials.iteritems():
-            first_password = True
             for p in passwords:
-                try:
-                    log.debug("Attempting to connect as %s", username)
-                    self.client.connect(hostname=self.fqdn, username=username, password=p, timeout=timeout, look_for_keys=False, allow_agent=False)
-                    log.info("Connection as %s succeeded!", username)
-                    self.connected = True
-                    # Nothing else to do, easiest just to return here rather
-                    # than break out of two loops.
-                    return
-                # We can eat most of these exceptions because we try multiple
-                # different auths. We need to hang on to it to re-raise in case
-                # we ultimately fail.
-                except AuthenticationException, e:
-                    log.debug("Authentication failure.")
-                    if first_password:
-                        log.warning("First password as %s didn't work.", username)
-                        first_password = False
-                    last_exc = e
-                except socket.error, e:
-                    # Exit out early if there is a socket error, such as:
-                    # ECONNREFUSED (Connection Refused). These errors are
-                    # typically raised at the OS level.
-                    from errno import errorcode
-                    log.debug("Socket Error (%s) - %s", errorcode[e[0]], e[1])
-                    last_exc = e
-                    break
+                if (username, p) not in attempts:
+                    attempts.append((username, p))
+        failed_users = set()
+        for username, p in attempts:
+            try:
+                log.debug("Attempting to connect as %s", username)
+                self.client.connect(hostname=self.fqdn, port=self.port, username=username, password=p, timeout=timeout, look_for_keys=False, allow_agent=False)
+                log.info("Connection as %s succeeded!", username)
+                # Every command is a few small request/reply packets, which
+                # Nagle's algorithm would otherwise hold back waiting for
+                # delayed ACKs.
+                self.client.get_transport().sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.connected = True
+                self.username = username
+                if self.credential_cache:
+                    self.credential_cache.remember(self.fqdn, self.name, username, p)
+                return
+            # We can eat most of these exceptions because we try multiple
+            # different auths. We need to hang on to it to re-raise in case
+            # we ultimately fail.
+            except AuthenticationException, e:
+                log.debug("Authentication failure.")
+                if (username, p) in preferred:
+                    log.info("Cached credentials as %s no longer work.", username)
+                    self.credential_cache.forget(self.fqdn, self.name, username, p)
+                elif username not in failed_users:
+                    log.warning("First password as %s didn't work.", username)
+                failed_users.add(username)
+                last_exc = e
+            except socket.error, e:
+                # Exit out early if there is a socket error, such as:
+                # ECONNREFUSED (Connection Refused). These errors are
+                # typically raised at the OS level, and no other
+                # credentials will fare any better.
+                from errno import errorcode
+                log.debug("Socket Error (%s) - %s", errorcode.get(e[0], e[0]), e[1])
+                last_exc = e
+                break
         if not self.connected:
             log.info("Couldn't connect with any credentials.")
+            self.client.close()
+            self.client = None
             raise last_exc
 
-    def disconnect(self):
+    def disconnect(self, reuse=True):
+        """Stops using the current connection. If this console has a pool
+        and "reuse" is True, the connection is handed back to the pool rather
+        than closed."""
         if self.connected:
-            self.client.close()
+            if self.pool and reuse:
+                self.pool.checkin(self.fqdn, self.username, self.client)
+            elif self.pool:
+                self.pool.close(self.fqdn, self.client)
+            else:
+                self.client.close()
+            self.client = None
         self.connected = False
-    
+
     def __del__(self):
         self.disconnect()
 
     def run_cmd(self, cmd, timeout=60):
-        """Runs a command on the remote console. In order to support weird SSH
-           servers that don't support "exec", we do this through a pty and
-           shell, which makes it more complicated than it needs to be. Rather
-           than letting the SSH server deal with retrieving the return code,
-           we need to get it through the shell by parsing $?."""
-        if (len(cmd) + self.max_prompt_size) > self.pty_width:
-            raise ValueError("Command '%s' exceeds pty width, cannot run it." % cmd)
+        """Runs a command on the remote console and returns a (rc, output)
+           tuple. See run_cmds() for details."""
+        return self.run_cmds([cmd], timeout=timeout)[0]
+
+    def run_cmds(self, cmds, timeout=60, stop_on_success=False):
+        """Runs a list of commands in order in a single session on the remote
+           console, and returns a list with a (rc, output) tuple for each
+           command that was run. If "stop_on_success" is True, no commands are
+           run after the first one that succeeds. "timeout" applies to each
+           command.
+
+           Where the SSH server supports it the commands are run through a
+           single "exec", and the return codes are echoed after each command
+           (or come straight from the channel, for a single command). In
+           order to support weird SSH servers that don't support "exec", we
+           fall back to running them through a pty and shell, which makes it
+           more complicated than it needs to be. Rather than letting the SSH
+           server deal with retrieving the return code, we need to get it
+           through the shell by parsing $?. Hosts that need the fallback are
+           remembered so we don't try "exec" on them again."""
+        use_exec = self.facts.get(self.name, "shell") != "pty"
+        if not use_exec:
+            for cmd in cmds:
+                self._check_pty_width(cmd)
 
         if not self.connected:
             self.connect()
 
-        log.debug("Running %s", cmd)
+        log.debug("Running %s", ", ".join(cmds))
         try:
-            output = None
-            rc = None
-            shell = self._get_shell()
-            shell.sendall("%s\r\necho $?\r\n" % cmd)
+            if use_exec:
+                results = self._exec_cmds(cmds, time.time() + timeout * len(cmds), stop_on_success)
+                if results is not None:
+                    return results
+                log.info("%s doesn't support exec, falling back to a shell.", self.fqdn)
+                self.facts.set(self.name, "shell", "pty")
+                for cmd in cmds:
+                    self._check_pty_width(cmd)
+            return self._shell_cmds(cmds, timeout, stop_on_success)
+        except:
+            logException(log.debug, "Caught exception while running command:")
+            # Something went wrong with the connection, don't reuse it.
+            self.disconnect(reuse=False)
+            raise RemoteCommandError("Caught exception while running command.")
+        finally:
+            self.disconnect()
+
+    def follow(self, path, patterns, timeout):
+        """Follows "path" on the remote console like "tail -F" does, starting
+           with its last line, and returns the first line that contains any
+           of "patterns" as soon as it shows up. Returns None if no such line
+           shows up within "timeout" seconds. Raises RemoteCommandError if
+           the connection is lost, after which it's fine to call this
+           again. Because the file can go quiet for a long time, the
+           connection is kept alive and checked on whenever nothing has
+           arrived for "follow_idle_timeout" seconds, so that one that has
+           silently gone away is noticed long before "timeout"."""
+        cmd = "tail -n1 -F %s" % path
+        log.debug("Following %s", path)
+        channel = None
+        transport = None
+        try:
+            if not self.connected:
+                self.connect()
+            deadline = time.time() + timeout
+            transport = self.client.get_transport()
+            transport.set_keepalive(self.follow_keepalive_interval)
+            if self.facts.get(self.name, "shell") != "pty":
+                channel = self.client.get_transport().open_session()
+                # A pty makes sure that "tail" gets killed when we close the
+                # channel, rather than lingering until it next writes.
+                channel.get_pty(width=self.pty_width)
+                try:
+                    channel.exec_command(cmd)
+                except SSHException:
+                    log.info("%s doesn't support exec, falling back to a shell.", self.fqdn)
+                    self.facts.set(self.name, "shell", "pty")
+                    channel.close()
+                    channel = None
+            if not channel:
+                self._check_pty_width(cmd)
+                channel = self._get_shell()
+                channel.sendall("%s\r\n" % cmd)
 
-            start = time.time()
             data = ""
-            while time.time() - start < timeout:
-                while shell.recv_ready():
-                    data += shell.recv(1024)
-
-                # Once we find this in the data, we know that the command
-                # has finished running. Now we have to dig around to get the
-                # command output and return code.
-                if "echo $?" in data:
-                    # First off, we should strip any shell escape codes that
-                    # may be present.
-                    data = re.sub(r"\x1b\[\d+;\d+f", "", data)
-                    # Then we need to roughly split up the output and return
-                    # code portions.
-                    output, status = data.split("echo $?\r\n")
-                    # The output needs lots of massaging to get right.
-                    # First we need to strip away everything up to and
-                    # including the echoing of the command we just ran.
-                    output = output.split("%s" % cmd)[1]
-                    # Then we strip away the new prompt that appeared after
-                    # the command was run.
-                    output = output.split("\r\n")[:-2]
-                    # Finally, join the output back together into a useful
-                    # string.
-                    output = "\n".join(output)
-                    # The return code is much easier -- we just want whatever
-                    # was on the first line of the output of "echo $?".
-                    rc = int(status.split("\r\n")[0])
-                    return rc, output
-                else:
-                    # Still waiting for the command to finish
-                    time.sleep(5)
-            else:
-                shell.close()
-                raise RemoteCommandError("Timed out when running command.")
+            while True:
+                try:
+                    chunk = self._recv(channel, min(deadline, time.time() + self.follow_idle_timeout))
+                except RemoteCommandError:
+                    if time.time() >= deadline:
+                        # Timed out, which isn't a problem with the connection.
+                        return None
+                    # Nothing new in the file, unless the connection is gone.
+                    if not transport.is_active():
+                        raise RemoteCommandError("Connection lost while following %s." % path)
+                    continue
+                if not chunk:
+                    raise RemoteCommandError("Channel closed while following %s." % path)
+                data += chunk
+                lines = data.split("\n")
+                # The last piece is an incomplete line, if anything.
+                data = lines.pop()
+                for line in lines:
+                    line = line.rstrip("\r")
+                    for pattern in patterns:
+                        if pattern in line:
+                            return line
         except:
-            logException(log.debug, "Caught exception while running command:")
-            raise RemoteCommandError("Caught exception while running command.", output=output, rc=rc)
+            logException(log.debug, "Caught exception while following %s:" % path)
+            # Something went wrong with the connection, don't reuse it.
+            if channel:
+                channel.close()
+                channel = None
+            self.disconnect(reuse=False)
+            raise RemoteCommandError("Caught exception while following %s." % path)
         finally:
+            if channel:
+                channel.close()
+            if transport and transport.is_active():
+                transport.set_keepalive(0)
             self.disconnect()
 
+    def _check_pty_width(self, cmd):
+        if (len(cmd) + self.max_prompt_size) > self.pty_width:
+            raise ValueError("Command '%s' exceeds pty width, cannot run it." % cmd)
+
+    def _recv(self, channel, deadline, size=4096):
+        """Waits for data on "channel" until "deadline", returning as soon as
+        any arrives. Returns an empty string once the channel is closed."""
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise RemoteCommandError("Timed out when running command.")
+        channel.settimeout(remaining)
+        try:
+            return channel.recv(size)
+        except socket.timeout:
+            raise RemoteCommandError("Timed out when running command.")
+
+    def _exec_cmds(self, cmds, deadline, stop_on_success):
+        """Runs "cmds" through a single "exec". Returns None if the server
+        doesn't support it."""
+        # With more than one command, we need to mark where each one's output
+        # ends and what it returned. The marker is unique to this call so that
+        # command output can't be mistaken for it.
+        marker = "SLAVEAPI_DONE_%s" % uuid4().hex
+        if len(cmds) == 1:
+            script = cmds[0]
+        else:
+            lines = []
+            for cmd in cmds:
+                lines.append(cmd)
+                # The extra newline makes sure the marker starts a line even
+                # if the output didn't end with one.
+                lines.append('rc=$?; echo; echo "%s $rc"' % marker)
+                if stop_on_success:
+                    lines.append("[ $rc -eq 0 ] && exit 0")
+            script = "\n".join(lines)
+
+        channel = self.client.get_transport().open_session()
+        try:
+            # A pty is needed for "sudo" on hosts whose sudoers has
+            # "requiretty", which would otherwise break "sudo reboot". It
+            # also merges stderr into the output, just like the shell does.
+            channel.get_pty(width=self.pty_width)
+            channel.set_combine_stderr(True)
+            try:
+                channel.exec_command(script)
+            except SSHException:
+                return None
+            reader = ChannelReader(self, channel, self.max_output_size)
+            results = []
+            buf = None
+            if len(cmds) > 1:
+                sentinel = re.compile(r"\r?\n%s (\d+)\r?\n" % marker)
+                overlap = len(marker) + 16
+                while len(results) < len(cmds):
+                    buf, match = reader.read_until(sentinel, overlap, deadline)
+                    if not match:
+                        break
+                    results.append((int(match.group(1)), self._exec_output(buf)))
+                    buf = None
+                    if stop_on_success and results[-1][0] == 0:
+                        break
+            # Whatever is left belongs to a command that didn't get as far as
+            # its marker, eg, because it exited the shell or there is only one
+            # command.
+            if buf is None:
+                buf, _ = reader.read_until(None, 0, deadline)
+            rc = channel.recv_exit_status()
+        finally:
+            channel.close()
+
+        if len(results) < len(cmds) and not (stop_on_success and results and results[-1][0] == 0):
+            results.append((rc, self._exec_output(buf)))
+        return results
+
+    def _exec_output(self, buf):
+        return buf.getvalue().replace("\r\n", "\n").rstrip("\n")
+
+    def _shell_cmds(self, cmds, timeout, stop_on_success):
+        shell = self._get_shell()
+        try:
+            reader = ChannelReader(self, shell, self.max_output_size)
+            results = []
+            for cmd in cmds:
+                rc, output = self._shell_cmd(reader, cmd, time.time() + timeout)
+                results.append((rc, output))
+                if stop_on_success and rc == 0:
+                    break
+            return results
+        finally:
+            shell.close()
+
+    # Once we find the output of "echo $?" in the data, we know that the
+    # command has finished running.
+    shell_status = re.compile(r"echo \$\?\r\n(\d+)\r\n")
+
+    def _shell_cmd(self, reader, cmd, deadline):
+        reader.channel.sendall("%s\r\necho $?\r\n" % cmd)
+        buf, match = reader.read_until(self.shell_status, 32, deadline)
+        if not match:
+            raise RemoteCommandError("Shell closed while running command.")
+        # Now we have to dig around to get the command output and return
+        # code. First off, we should strip any shell escape codes that may be
+        # present.
+        output = re.sub(r"\x1b\[\d+;\d+f", "", buf.getvalue())
+        # The output needs lots of massaging to get right.
+        # First we need to strip away everything up to and
+        # including the echoing of the command we just ran.
+        output = output.split("%s" % cmd, 1)[1]
+        # Then we strip away the new prompt that appeared after
+        # the command was run.
+        output = output.split("\r\n")[:-2]
+        # Finally, join the output back together into a useful
+        # string.
+        output = "\n".join(output)
+        # The return code is much easier -- we just want whatever
+        # was output by "echo $?".
+        rc = int(match.group(1))
+        return rc, output
 
     def reboot(self):
         log.info("Attempting to reboot")
 
-        for cmd in self.reboot_commands:
-            rc, output = self.run_cmd(cmd)
-            if rc == 0:
-                log.info("Successfully initiated reboot")
-                # Success! We're done!
-                return
+        # Start with the command that worked last time, if we know it.
+        commands = list(self.reboot_commands)
+        known = self.facts.get(self.name, "reboot_command")
+        if known is not None and known < len(commands):
+            commands.insert(0, commands.pop(known))
+        results = self.run_cmds(commands, stop_on_success=True)
+        rc, output = results[-1]
+        if rc == 0:
+            cmd = commands[len(results) - 1]
+            log.info("Successfully initiated reboot with '%s'", cmd)
+            self.facts.set(self.name, "reboot_command", self.reboot_commands.index(cmd))
+            # Connections to the host won't survive the reboot.
+            if self.pool:
+                self.pool.discard(self.fqdn)
         else:
+            self.facts.invalidate(self.name, "reboot_command")
             # XXX: raise a better exception here
             raise RemoteCommandError("Unable to reboot %s after trying all commands" % self.fqdn)
 
@@ -175,20 +735,36 @@ class SSHConsole(object):
         # Even after the SSH connection is made, some shells may take awhile
         # to launch (see bug 943508 for an example). Because of this, we
         # need to verify that the shell is ready before returning. We can use
-        # a magic string ("SHELL_READY") to do this -- once we see it in the
-        # output, we know the shell is responsive. It may look a little strange
-        # to send this in each iteration of the loop but because we're waiting
-        # on the shell to be ready we can't rely on any characters we send to
-        # be buffered - we need to resend them over and over.
-        for i in range(timeout/2):
-            shell.sendall("\r\necho SHELL_READY\r\n")
-            data = ""
-            time.sleep(1)
-            while shell.recv_ready():
-                data += shell.recv(1024)
-            if "SHELL_READY" in data:
-                return shell
-            else:
-                time.sleep(1)
-        else:
+        # a magic string ("SHELL_READY") to do this -- once we see it output
+        # on a line of its own, we know the shell is responsive. Because
+        # we're waiting on the shell to be ready we can't rely on any
+        # characters we send to be buffered, so we need to resend them until
+        # it answers. We wait twice as long after each resend so that slow
+        # shells aren't flooded, and start out waiting a bit longer than the
+        # host's last shell took, so known slow hosts aren't either.
+        start = time.time()
+        deadline = start + timeout
+        wait = min(max(self.facts.get(self.name, "shell_startup", 0) * 1.5, self.shell_ready_min_wait),
+                   self.shell_ready_max_wait)
+        data = ""
+        try:
+            while time.time() < deadline:
+                shell.sendall("\r\necho SHELL_READY\r\n")
+                resend = min(time.time() + wait, deadline)
+                while time.time() < resend:
+                    shell.settimeout(resend - time.time())
+                    try:
+                        chunk = shell.recv(4096)
+                    except socket.timeout:
+                        break
+                    if not chunk:
+                        raise RemoteCommandError("Shell closed before becoming ready.")
+                    data += chunk
+                    if re.search(r"(^|\n)SHELL_READY\r?\n", data):
+                        self.facts.set(self.name, "shell_startup", time.time() - start)
+                        return shell
+                wait = min(wait * 2, self.shell_ready_max_wait)
             raise RemoteCommandError("Shell never became ready.")
+        except:
+            shell.close()
+            raise
@@ -0,0 +1,44 @@
+import time
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class HostFacts(object):
+    """Remembers things that have been learned about hosts and rarely change,
+    such as which OS family a host is, whether its SSH server supports
+    "exec", or which reboot command works on it. This lets actions go
+    straight to what works instead of finding out again every time. Facts
+    expire "ttl" seconds after they were learned, and should be invalidated
+    as soon as they are found to be wrong."""
+
+    def __init__(self, ttl=60 * 60 * 24):
+        self.ttl = ttl
+        # host -> {fact name -> (value, time it was learned)}
+        self._facts = {}
+
+    def configure(self, ttl):
+        self.ttl = ttl
+
+    def get(self, host, fact, default=None):
+        learned = self._facts.get(host, {}).get(fact)
+        if not learned:
+            return default
+        value, learned_at = learned
+        if time.time() - learned_at > self.ttl:
+            del self._facts[host][fact]
+            return default
+        return value
+
+    def set(self, host, fact, value):
+        if self._facts.get(host, {}).get(fact, (None,))[0] != value:
+            log.debug("Learned %s of %s: %s", fact, host, value)
+        self._facts.setdefault(host, {})[fact] = (value, time.time())
+
+    def invalidate(self, host, fact=None):
+        """Forgets "fact" about "host", or everything about it if "fact" is
+        None."""
+        if fact is None:
+            self._facts.pop(host, None)
+        else:
+            self._facts.get(host, {}).pop(fact, None)
@@ -1,5 +1,3 @@
-from collections import defaultdict
-
 from gevent import queue
 from gevent import local
 
@@ -7,16 +5,33 @@ log_data = local.local()
 
 from bzrest.client import BugzillaClient
 
+from .actions.results import ResultStore, BatchStore
+from .clients.dnscache import DNSCache
+from .clients.ipmi import IPMICapabilityCache
+from .clients.ssh import SSHConnectionPool, CredentialCache
+from .facts import HostFacts
+
 messages = queue.Queue()
 
 config = {}
 bugzilla_client = BugzillaClient()
-results = defaultdict(lambda: defaultdict(dict))
+dns_cache = DNSCache()
+ipmi_cache = IPMICapabilityCache()
+ssh_pool = SSHConnectionPool()
+ssh_credential_cache = CredentialCache()
+facts = HostFacts()
+results = ResultStore()
+batches = BatchStore()
+
+from .journal import Journal
+journal = Journal()
 
 from .processor import Processor
 processor = Processor()
 
 from .messenger import Messenger
 messenger = Messenger()
+messenger.subscribe(results.record_events)
+messenger.subscribe(journal.record_events)
 
 semaphores = {}
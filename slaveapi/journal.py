@@ -0,0 +1,208 @@
+import json
+import logging
+import os
+
+from gevent import get_hub, sleep, spawn
+try:
+    from gevent.lock import Semaphore
+except ImportError:
+    from gevent.coros import Semaphore
+
+from .actions.results import PENDING, RUNNING, SUCCESS, FAILURE
+from .util import logException
+
+log = logging.getLogger(__name__)
+
+
+class Journal(object):
+    """An append-only log of the work added to the Processor and of the state
+    transitions of its ActionResults (as delivered by the Messenger), which
+    lets a restarted server pick up where the last one left off.
+
+    Records are buffered in memory and written out, and fsync'ed, in batches
+    every "sync_interval" seconds so that recording them never waits on the
+    disk. Writing and compacting happen in gevent's threadpool, so that a
+    slow disk doesn't hold up every other greenlet either. Each line of the
+    journal is a JSON object: "enqueue" records describe newly added work
+    and "state" records describe a transition of its result. Whenever enough
+    records have been written the journal is rewritten to contain only the
+    results that are still held in the ResultStore."""
+    # How many records to write before compacting the journal.
+    compact_threshold = 10000
+
+    def __init__(self):
+        self.path = None
+        self.sync_interval = 1
+        self._results = None
+        self._file = None
+        self._buffer = []
+        self._records = 0
+        # Held while writing to or rewriting the journal.
+        self._io_lock = Semaphore()
+        # requestid -> enqueue record, for work that hasn't finished yet.
+        self._unfinished = {}
+
+    @property
+    def opened(self):
+        return self._file is not None
+
+    def open(self, path, results, sync_interval=1):
+        """Opens the journal at "path" and starts writing to it. Returns a
+        list of the entries found in it, oldest first. Each entry is a dict
+        containing the fields of the enqueue record for a request, updated
+        with the fields of the latest state record for it.
+
+        Once the entries have been restored into "results", compact() should
+        be called, so that the journal drops the ones that "results" didn't
+        keep (and any partly written record at its end)."""
+        self.path = path
+        self.sync_interval = sync_interval
+        self._results = results
+        entries = self._load()
+        for entry in entries:
+            if entry.get("state", PENDING) in (PENDING, RUNNING):
+                self._unfinished[entry["requestid"]] = entry
+        self._file = open(self.path, "a")
+        spawn(self._flush_loop)
+        return entries
+
+    def close(self):
+        if self.opened:
+            self.flush()
+            with self._io_lock:
+                self._file.close()
+                self._file = None
+
+    def record_enqueue(self, res, args, kwargs):
+        if not self.opened:
+            return
+        record = {
+            "type": "enqueue",
+            "requestid": res.id_,
+            "slave": res.slave,
+            "action": res.action,
+            "args": args,
+            "kwargs": kwargs,
+            "request_timestamp": res.request_timestamp,
+        }
+        if self._append(record):
+            self._unfinished[res.id_] = record
+
+    def record_events(self, events):
+        """Records a batch of ActionResult transition events, as delivered by
+        the :py:class:`slaveapi.messenger.Messenger`."""
+        if not self.opened:
+            return
+        for event in events:
+            self._append(self._state_record(event))
+            if event["state"] in (SUCCESS, FAILURE):
+                self._unfinished.pop(event["requestid"], None)
+
+    def flush(self):
+        with self._io_lock:
+            if not self._buffer:
+                return
+            data = "".join(self._buffer)
+            self._buffer = []
+            get_hub().threadpool.apply(self._write, (data,))
+        if self._records >= self.compact_threshold:
+            self.compact()
+
+    def compact(self):
+        """Rewrites the journal so that it only contains the results still
+        held in the ResultStore. Records made while this is going on are
+        kept in the buffer, and end up after the rewritten ones."""
+        with self._io_lock:
+            log.debug("Compacting journal %s", self.path)
+            # The entries are collected here, rather than in the thread, so
+            # that the ResultStore doesn't change underneath us.
+            entries = []
+            for res in self._results:
+                entry = self._unfinished.get(res.id_)
+                if entry is None:
+                    entry = {"requestid": res.id_, "slave": res.slave,
+                             "action": res.action, "args": [], "kwargs": {},
+                             "request_timestamp": res.request_timestamp}
+                entry = dict(entry, **self._state_record(res.to_event()))
+                entries.append(entry)
+            # Everything buffered so far is covered by the entries.
+            self._buffer = []
+            records = self._records
+            get_hub().threadpool.apply(self._rewrite, (entries,))
+            self._records -= records
+
+    def _write(self, data):
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _rewrite(self, entries):
+        self._file.close()
+        try:
+            self._write_compacted(entries)
+        finally:
+            self._file = open(self.path, "a")
+
+    def _state_record(self, event):
+        record = {"type": "state"}
+        for key in ("requestid", "state", "text", "start_timestamp",
+                    "finish_timestamp"):
+            record[key] = event[key]
+        return record
+
+    def _append(self, record):
+        try:
+            self._buffer.append(json.dumps(record) + "\n")
+        except (TypeError, ValueError):
+            logException(log.error, "Couldn't journal %s" % record)
+            return False
+        self._records += 1
+        return True
+
+    def _flush_loop(self):
+        while self.opened:
+            sleep(self.sync_interval)
+            try:
+                if self.opened:
+                    self.flush()
+            except Exception:
+                logException(log.error, "Couldn't write to journal %s" % self.path)
+
+    def _load(self):
+        entries = {}
+        if not os.path.exists(self.path):
+            return []
+        for line in open(self.path):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Most likely the tail end of a write that was interrupted
+                # by a crash.
+                log.warning("Skipping unreadable journal record: %r", line)
+                continue
+            requestid = record["requestid"]
+            if record["type"] == "enqueue":
+                entries[requestid] = record
+            elif requestid in entries:
+                entries[requestid].update(record)
+        return sorted(entries.values(), key=lambda e: e["requestid"])
+
+    def _write_compacted(self, entries):
+        tmp = "%s.tmp" % self.path
+        f = open(tmp, "w")
+        for entry in entries:
+            enqueue = {"type": "enqueue"}
+            for key in ("requestid", "slave", "action", "args", "kwargs",
+                        "request_timestamp"):
+                enqueue[key] = entry[key]
+            f.write(json.dumps(enqueue) + "\n")
+            if "state" in entry:
+                state = {"type": "state"}
+                for key in ("requestid", "state", "text", "start_timestamp",
+                            "finish_timestamp"):
+                    state[key] = entry[key]
+                f.write(json.dumps(state) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+        os.rename(tmp, self.path)
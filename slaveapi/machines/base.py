@@ -1,37 +1,97 @@
 import time
 
 from dns import resolver
+from gevent import Timeout
+from gevent.pool import Group
 
 from ..clients import inventory
-from ..clients.ipmi import IPMIInterface
 from ..clients.pdu import PDU
 from ..clients.ping import ping
-from ..global_state import config
+from ..global_state import config, dns_cache, ipmi_cache
+from ..util import logException
 
 import logging
 log = logging.getLogger(__name__)
 
 class Machine(object):
+    # Seconds that load_all_info waits for each source of information before
+    # giving up on it. Can be overridden by config["load_timeouts"].
+    load_timeouts = {
+        "inventory": 30,
+        # Probing IPMI retries flaky interfaces a few times.
+        "ipmi": 90,
+    }
+    # Attributes that are loaded the first time they're used, and the
+    # load_*_info methods that load them. The methods can still be called
+    # directly to load (or reload) things ahead of time.
+    lazy_attributes = {
+        "pdu": "load_inventory_info",
+        "ipmi": "load_ipmi_info",
+    }
+
     def __init__(self, name):
         if "." not in name:
             name += "." + config["default_domain"]
-        answer = resolver.query(name)
+        answer = dns_cache.query(name)
         self.name = answer.canonical_name.to_text().split(".")[0]
         self.domain = answer.canonical_name.parent().to_text().rstrip(".")
         self.ip = answer[0].to_text()
         # Per IT, parsing the FQDN is the best way to find the colo.
         # Our hostnames always end in $colo.mozilla.com.
         self.colo = self.fqdn.split(".")[-3]
-        self.ipmi = None
-        self.pdu = None
+        # source -> why load_all_info couldn't load it
+        self.load_errors = {}
+
+    def __getattr__(self, name):
+        # Only called for attributes that haven't been set yet.
+        loader = self.lazy_attributes.get(name)
+        if not loader:
+            raise AttributeError("%r object has no attribute %r" % (self.__class__.__name__, name))
+        getattr(self, loader)()
+        # Whatever the loader didn't find doesn't exist, don't look again.
+        for attr, attr_loader in self.lazy_attributes.iteritems():
+            if attr_loader == loader:
+                self.__dict__.setdefault(attr, None)
+        return self.__dict__[name]
+
+    def _get_loaded(self, name):
+        """Returns the lazy attribute "name" if it's been loaded, or None
+        without loading it."""
+        return self.__dict__.get(name)
 
     @property
     def fqdn(self):
         return "%s.%s" % (self.name, self.domain)
 
     def load_all_info(self):
-        self.load_inventory_info()
-        self.load_ipmi_info()
+        self._load_concurrently({
+            "inventory": self.load_inventory_info,
+            "ipmi": self.load_ipmi_info,
+        })
+
+    def _load_concurrently(self, loaders):
+        """Runs each of "loaders" (a dict of source -> load_*_info method) at
+        the same time, each limited to its source's load timeout. Sources
+        that fail or time out are recorded in self.load_errors rather than
+        raised, so that one slow or broken backend doesn't stop the others
+        from being reported."""
+        self.load_errors = {}
+        group = Group()
+        for source, loader in loaders.iteritems():
+            group.spawn(self._load_one, source, loader)
+        group.join()
+
+    def _load_one(self, source, loader):
+        timeout = config.get("load_timeouts", {}).get(source, self.load_timeouts[source])
+        try:
+            with Timeout(timeout):
+                loader()
+        except Timeout:
+            log.error("Timed out loading %s info after %d seconds", source, timeout)
+            self.load_errors[source] = "Timed out after %d seconds" % timeout
+        except Exception, e:
+            logException(log.error, "Couldn't load %s info" % source)
+            self.load_errors[source] = "%s: %s" % (e.__class__.__name__, e)
 
     def load_inventory_info(self):
         """ Loads useful data from inventory.
@@ -40,12 +100,16 @@ class Machine(object):
         Uses self.fqdn"""
 
         log.info("Getting inventory info")
-        info = inventory.get_system(self.fqdn)
+        info = self._get_inventory_info()
+        self.pdu = None
         if info["pdu_fqdn"]:
             self.pdu = PDU(info["pdu_fqdn"], info["pdu_port"])
         # Return info to allow subclasses to do stuff with data, without refetching
         return info
 
+    def _get_inventory_info(self):
+        return inventory.get_system(self.fqdn)
+
     def load_ipmi_info(self):
         """ Loads ipmi info for this machine if it exists.
         By querying DNS for a -mgmt hostname, and checks it.
@@ -54,12 +118,13 @@ class Machine(object):
 
         # Also per IT, the IPMI Interface, if it exists, can
         # always be found by appending "-mgmt.build.mozilla.org" to the name.
+        self.ipmi = None
         try:
             ipmi_fqdn = "%s-mgmt.%s" % (self.name, config["default_domain"])
-            resolver.query(ipmi_fqdn)
+            dns_cache.query(ipmi_fqdn)
             # This will return None if the IPMI interface doesn't work for some
-            # reason.
-            self.ipmi = IPMIInterface.get_if_exists(ipmi_fqdn, config["ipmi_username"], config["ipmi_password"])
+            # reason. Whether it works is cached, so this is usually quick.
+            self.ipmi = ipmi_cache.get_interface(ipmi_fqdn, config["ipmi_username"], config["ipmi_password"])
         except resolver.NXDOMAIN:
             # IPMI Interface doesn't exist.
             pass
@@ -67,7 +132,7 @@ class Machine(object):
     def to_dict(self):
         """Serializes the state of a Machine. It is up to the caller to ensure that
         any desired information (slavealloc, etc.) is loaded prior to
-        serialization."""
+        serialization. Attributes that haven't been loaded are None."""
 
         data = {
             "fqdn": self.fqdn,
@@ -76,15 +141,18 @@ class Machine(object):
             "colo": self.colo,
             "ipmi": None,
             "pdu": None,
+            "errors": self.load_errors,
         }
-        if self.ipmi:
+        ipmi = self._get_loaded("ipmi")
+        if ipmi:
             data["ipmi"] = {
-                "fqdn": self.ipmi.fqdn,
+                "fqdn": ipmi.fqdn,
             }
-        if self.pdu:
+        pdu = self._get_loaded("pdu")
+        if pdu:
             data["pdu"] = {
-                "fqdn": self.pdu.fqdn,
-                "port": self.pdu.port,
+                "fqdn": pdu.fqdn,
+                "port": pdu.port,
             }
         return data
 
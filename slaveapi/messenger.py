@@ -1,35 +1,53 @@
 import logging
 
+from gevent import queue, spawn
+
 from .global_state import messages, log_data
+from .util import logException
 
 log = logging.getLogger(__name__)
 
 
 class Messenger(object):
+    """Fans out ActionResult transitions to subscribers. Workers apply
+    transitions to their results directly (see
+    :py:meth:`slaveapi.actions.results.ActionResult.transition`) and put the
+    resulting events into the "messages" queue. The Messenger drains that
+    queue and calls each subscriber once with every event that has piled up
+    since the last time, oldest first."""
+    # Most events to hand to subscribers at once.
+    max_batch = 500
+
     def __init__(self):
-        pass
+        self.subscribers = []
+        self._greenlet = None
+
+    def subscribe(self, subscriber):
+        """Registers "subscriber", which will be called with a list of
+        events. Subscribers must not block."""
+        self.subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.remove(subscriber)
+
+    def start(self):
+        """Starts delivering events, unless that's already happening."""
+        if not self._greenlet:
+            self._greenlet = spawn(self)
 
     def __call__(self):
         # use "-M-" for messenger as our "slave"
         log_data.slave = "-M-"
         while True:
-            msg = messages.get()
-            log.debug("Got message: %s", msg)
-            state, item = msg[0:2]
-            try:
-                text = msg[2]
-            except IndexError:
-                text = ""
-            try:
-                start_ts = msg[3]
-            except IndexError:
-                start_ts = 0
-            try:
-                finish_ts = msg[4]
-            except IndexError:
-                finish_ts = 0
-            slave, action, args, kwargs, res = item
-            res.state = state
-            res.text = text
-            res.start_timestamp = start_ts
-            res.finish_timestamp = finish_ts
+            batch = [messages.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(messages.get_nowait())
+                except queue.Empty:
+                    break
+            log.debug("Delivering %d events", len(batch))
+            for subscriber in list(self.subscribers):
+                try:
+                    subscriber(batch)
+                except Exception:
+                    logException(log.error, "Subscriber %s failed to handle events" % subscriber)
@@ -0,0 +1,181 @@
+from datetime import datetime
+import re
+import time
+
+import dateutil.parser
+
+from .clients.ssh import RemoteCommandError
+
+import logging
+log = logging.getLogger(__name__)
+
+# Commands that tell us how long a host has been up, by OS family. When we
+# don't know what a host runs yet, we try the Unix one first.
+UPTIME_COMMANDS = {
+    "unix": "uptime",
+    "windows": "net statistics server",
+    None: "uptime 2>/dev/null || net statistics server",
+}
+
+
+def get_windows_uptime(cmd_text):
+    """Parse the output from `net statistics server` and
+    return the length of time in seconds the server has been up.
+    """
+    for line in cmd_text.splitlines():
+        # looking for something like:
+        # Statistics since 3/26/2014 7:14:07 AM
+        match = re.match('Statistics since (.+)', line)
+        if match:
+            _timedelta = datetime.today() - dateutil.parser.parse(match.group(1))
+            return int(_timedelta.total_seconds())
+    return None
+
+
+def get_unix_uptime(cmd_text):
+    """Parse the output from UNIX `uptime` and return the
+    length of time in seconds the server has been up.
+    """
+    for line in cmd_text.splitlines():
+        # look for something resembling one of these:
+        # 10:38:58 up 78 days, 21:57,  3 users,  load average: 0.01, 0.07, 0.13
+        # 10:37  up 1 day, 12:02, 7 users, load averages: 0.62 0.47 0.45
+        # 07:38:12 up 33 min,  1 user,  load average: 4.26, 4.24, 3.51
+        # 08:18:28 up 0 min,  2 users,  load average: 1.52, 0.40, 0.13
+        # 10:18:11 up  2:00,  2 users,  load average: 0.07, 0.02, 0.00
+        up_seconds = None
+        match = re.search('up\s+(\d+)\s+(\w+)(?:,\s+(\d{1,2}):(\d{2}))?', line)
+        if match:
+            m1 = int(match.group(1))
+            m1_unit = match.group(2)
+            hh = mm = None
+            if len(match.groups()) > 2:
+                hh = match.group(3)
+                mm = match.group(4)
+            to_seconds = {
+                'day': 60 * 60 * 24,
+                'days': 60 * 60 * 24,
+                'min': 60,
+            }
+            up_seconds = m1 * to_seconds[m1_unit]
+            if hh and mm:
+                up_seconds = up_seconds + int(hh) * 60 * 60 + int(mm) * 60
+        else:
+            match = re.search('up\s+(\d{1,2}):(\d{2})', line)
+            if match:
+                hh = match.group(1)
+                mm = match.group(2)
+                up_seconds = int(hh) * 60 * 60 + int(mm) * 60
+        if up_seconds is not None:
+            return(up_seconds)
+
+
+def get_os_family(cmd_text):
+    """Parse the output from `uname -s` and return the OS family ("unix" or
+    "windows"), or None if it's not recognizable. Windows slaves run their
+    commands through msys (or cygwin), which report themselves as such.
+    """
+    uname = cmd_text.strip().upper()
+    if not uname:
+        return None
+    if uname.startswith(("MINGW", "MSYS", "CYGWIN")):
+        return "windows"
+    return "unix"
+
+
+def get_load(cmd_text):
+    """Parse the output from UNIX `uptime` and return the 1, 5 and 15 minute
+    load averages.
+    """
+    # looking for something like either of:
+    # load average: 0.01, 0.07, 0.13
+    # load averages: 0.62 0.47 0.45
+    match = re.search(r"load averages?:\s+([\d.]+),?\s+([\d.]+),?\s+([\d.]+)", cmd_text)
+    if match:
+        return [float(load) for load in match.groups()]
+    return None
+
+
+def get_free_disk(cmd_text):
+    """Parse the output from `df -Pk` for a single path and return the
+    number of bytes free on its filesystem.
+    """
+    # looking for the line after the header, which is something like:
+    # /dev/sda1   51475068 39150936  9702688      81% /
+    lines = cmd_text.strip().splitlines()
+    if len(lines) < 2:
+        return None
+    try:
+        return int(lines[-1].split()[3]) * 1024
+    except (IndexError, ValueError):
+        return None
+
+
+def probe(console, basedir=None, log_lines=100):
+    """Finds out the state of a slave with one batch of commands (see
+    SSHConsole.run_cmds), which takes a single round trip on hosts that
+    support "exec". Free disk and twistd.log are only looked at if "basedir"
+    is given. Returns a dictionary of the form:
+    {
+        'os': # "unix" or "windows", or None if unknown
+        'uptime': # machine uptime, in seconds
+        'boot_time': # when the machine booted, in seconds since the epoch
+        'load': # 1, 5 and 15 minute load averages (Unix only)
+        'free_disk': # bytes free on the filesystem basedir is on
+        'twistd_log': # the last "log_lines" lines of twistd.log.1 and twistd.log
+    }
+    Anything that couldn't be found out is None. Raises RemoteCommandError
+    if the commands couldn't be run.
+    """
+    known_os = console.facts.get(console.name, "os")
+    cmds = [
+        "uname -s",
+        UPTIME_COMMANDS[known_os],
+    ]
+    if basedir:
+        cmds += [
+            "df -Pk %s" % basedir,
+            "tail -n %(lines)d %(basedir)s/twistd.log.1 %(basedir)s/twistd.log" % {
+                "lines": log_lines, "basedir": basedir},
+        ]
+    started = time.time()
+    results = console.run_cmds(cmds)
+    if len(results) < len(cmds):
+        raise RemoteCommandError("Probe ended early after '%s'" % cmds[len(results) - 1])
+    (uname_rc, uname), (uptime_rc, uptime_text) = results[:2]
+    free_disk = tail = None
+    if basedir:
+        (df_rc, df), (tail_rc, tail) = results[2:]
+        if df_rc == 0:
+            free_disk = get_free_disk(df)
+
+    os_family = (uname_rc == 0 and get_os_family(uname)) or known_os
+    if os_family:
+        console.facts.set(console.name, "os", os_family)
+
+    uptime = None
+    load = None
+    if uptime_rc == 0:
+        # Which uptime command ran was decided before we knew the OS for
+        # sure, so fall back to the other parser if need be.
+        parsers = [get_unix_uptime, get_windows_uptime]
+        if os_family == "windows":
+            parsers.reverse()
+        for parse in parsers:
+            uptime = parse(uptime_text)
+            if uptime is not None:
+                break
+        load = get_load(uptime_text)
+    else:
+        log.debug("Couldn't get uptime: %s", uptime_text)
+
+    return {
+        "os": os_family,
+        "uptime": uptime,
+        "boot_time": started - uptime if uptime is not None else None,
+        "load": load,
+        "free_disk": free_disk,
+        # The return code is disregarded because it will be non-zero if
+        # twistd.log.1 is not found.
+        "twistd_log": tail,
+    }
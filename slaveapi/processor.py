@@ -1,78 +1,185 @@
 import logging
 import time
 
-from gevent import queue, spawn
+from gevent import getcurrent, spawn
 
-from .actions.results import ActionResult, RUNNING, FAILURE
-from .global_state import messages, log_data
+from .actions import get_action
+from .actions.results import ActionResult, PENDING, RUNNING, FAILURE
+from .global_state import messages, log_data, results, journal
+from .scheduler import SlaveLanes
 from .util import logException
 
 log = logging.getLogger(__name__)
 
 
 class Processor(object):
-    max_jobs = 20
+    """Runs queued work on a pool of "concurrency" long lived workers. If
+    "max_jobs" is set, each worker is replaced with a fresh one after it has
+    run that many pieces of work."""
+    max_jobs = None
 
     def __init__(self):
         self._message_loop = None
         self.stopped = False
+        self.concurrency = 0
         self.workers = []
-        self.work_queue = queue.Queue()
+        # Work for the same slave is run in order, one piece at a time, and
+        # quick actions are run ahead of long ones.
+        self.work_queue = SlaveLanes()
+        # Maps the key of each pending or running piece of work (see
+        # _work_key) to its ActionResult.
+        self.in_flight = {}
 
-    def configure(self, concurrency):
+    def configure(self, concurrency, shares=None, max_jobs=None, reserved=1):
+        """Sets the number of workers to run, starting or stopping workers
+        as needed. "shares" maps priority classes to the fraction of
+        "concurrency" that their work may use, and "reserved" workers are
+        kept for interactive work. See
+        :py:data:`slaveapi.scheduler.priority_classes` for the defaults.
+        Workers that are busy when the pool shrinks finish their current work
+        before stopping."""
         self.concurrency = concurrency
+        self.max_jobs = max_jobs
+        self.work_queue.configure(concurrency, shares, reserved)
+        self._resize()
 
     def add_work(self, slave, action, *args, **kwargs):
+        return self.submit(slave, action, args, kwargs)
+
+    def submit(self, slave, action, args=(), kwargs=None, coalesce=True):
+        """Queues up "action" to be run against "slave" and returns its
+        ActionResult. If "coalesce" is True and identical work (same slave,
+        action, and arguments) is already pending or running, the
+        ActionResult for that work is returned instead of queueing it
+        again."""
+        if kwargs is None:
+            kwargs = {}
+        if coalesce:
+            res = self.in_flight.get(self._work_key(slave, action.__name__, args, kwargs))
+            if res and not res.is_done():
+                log.info("Coalescing %s of %s into request %s", res.action, slave, res.id_)
+                return res
+
         res = ActionResult(slave, action.__name__)
-        item = (slave, action, args, kwargs, res)
+        results.add(res)
+        journal.record_enqueue(res, args, kwargs)
+        self._enqueue((slave, action, args, kwargs, res))
+        return res
+
+    def restore(self, entries):
+        """Restores results and work from journal entries (see
+        :py:meth:`slaveapi.journal.Journal.open`). Finished results are
+        put back as they were and pending work is added back to the queue.
+        Work that was running when the server went away is marked as failed,
+        because there's no way to know how far it got."""
+        for entry in entries:
+            res = ActionResult(entry["slave"], entry["action"],
+                               request_timestamp=entry["request_timestamp"],
+                               requestid=entry["requestid"])
+            state = entry.get("state", PENDING)
+            # Results are finished before they're added to the store, so that
+            # it knows they can be evicted.
+            if state == PENDING:
+                log.info("Restoring pending %s of %s", res.action, res.slave)
+                results.add(res)
+                kwargs = dict((str(k), v) for k, v in entry["kwargs"].iteritems())
+                action = get_action(res.action)
+                self._enqueue((res.slave, action, tuple(entry["args"]), kwargs, res))
+            elif state == RUNNING:
+                log.info("Failing %s of %s, it was interrupted", res.action, res.slave)
+                self._transition(res, FAILURE, "Interrupted by a SlaveAPI restart.",
+                                 entry["start_timestamp"], time.time())
+                results.add(res)
+            else:
+                res.transition(state, entry["text"], entry["start_timestamp"],
+                               entry["finish_timestamp"])
+                results.add(res)
+
+    def _transition(self, res, state, text, start_ts, finish_ts=0):
+        messages.put(res.transition(state, text, start_ts, finish_ts))
+
+    def _work_key(self, slave, action_name, args, kwargs):
+        key = (slave, action_name, tuple(args), tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            # Work with unhashable arguments is never coalesced.
+            return None
+        return key
+
+    def _enqueue(self, item):
         log.debug("Adding work to queue: %s", item)
+        slave, action, args, kwargs, res = item
+        key = self._work_key(slave, res.action, args, kwargs)
+        if key is not None:
+            self.in_flight[key] = res
         self.work_queue.put(item)
-        self._start_worker()
-        return res
+
+    def _work_done(self, item):
+        slave, action, args, kwargs, res = item
+        key = self._work_key(slave, res.action, args, kwargs)
+        # Identical work may have been queued up since, with coalescing
+        # turned off. Only forget about the key if it's still ours.
+        if self.in_flight.get(key) is res:
+            del self.in_flight[key]
+        self.work_queue.done(item)
+
+    def _resize(self):
+        while len(self.workers) < self.concurrency and not self.stopped:
+            self._start_worker()
+        if len(self.workers) > self.concurrency:
+            # Idle workers will notice that there's too many of them.
+            self.work_queue.wake()
 
     def _start_worker(self):
-        if len(self.workers) < self.concurrency:
-            log.debug("Spawning new worker")
-            t = spawn(self._worker)
-            t.link(self._worker_done)
-            self.workers.append(t)
+        log.debug("Spawning new worker")
+        t = spawn(self._worker)
+        t.link(self._worker_done)
+        self.workers.append(t)
 
     def _worker_done(self, t):
-        self.workers.remove(t)
-        if self.work_queue.qsize() and not self.stopped:
-            self._start_worker()
+        # Workers that stopped because the pool shrunk have already removed
+        # themselves.
+        if t in self.workers:
+            self.workers.remove(t)
+        self._resize()
 
     def _worker(self):
         jobs = 0
-        while True:
-            try:
-                # Reset slave to empty
-                log_data.slave = "-.-"
+        while self.max_jobs is None or jobs < self.max_jobs:
+            # Reset slave to empty
+            log_data.slave = "-.-"
+            if self.stopped or len(self.workers) > self.concurrency:
+                # Remove ourselves right away, so that other workers don't
+                # stop too.
+                self.workers.remove(getcurrent())
+                log.debug("Stopping worker, pool has shrunk")
+                return
+            # Skips over slaves that already have work running.
+            item = self.work_queue.get(block=True)
+            if item:
                 jobs += 1
-                try:
-                    item = self.work_queue.get(block=False)
-                    if not item:
-                        break
-                except queue.Empty:
-                    break
-
-                log.info("Processing item: %s", item)
-                slave, action, args, kwargs, res = item
-                log_data.slave = slave
-                start_ts = time.time()
-                messages.put((RUNNING, item, "In Progress", start_ts))
-                res, msg = action(slave, *args, **kwargs)
-                log.info("Finished Processing item: %s", item)
-                finish_ts = time.time()
-
-                messages.put((res, item, msg, start_ts, finish_ts))
-
-                # todo, bail after max jobs
-                if jobs >= self.max_jobs:
-                    break
-            except Exception, e:
-                finish_ts = time.time()
-                logException(log.error, "Something went wrong while processing!")
-                if item:
-                    log.debug("Item was: %s", item)
-                messages.put((FAILURE, item, str(e), start_ts, finish_ts))
+                self._process(item)
+        log.debug("Recycling worker after %d jobs", jobs)
+
+    def _process(self, item):
+        start_ts = time.time()
+        try:
+            log.info("Processing item: %s", item)
+            slave, action, args, kwargs, res = item
+            log_data.slave = slave
+            self._transition(res, RUNNING, "In Progress", start_ts)
+            state, msg = action(slave, *args, **kwargs)
+            log.info("Finished Processing item: %s", item)
+            finish_ts = time.time()
+
+            self._transition(res, state, msg, start_ts, finish_ts)
+        except Exception, e:
+            finish_ts = time.time()
+            logException(log.error, "Something went wrong while processing!")
+            log.debug("Item was: %s", item)
+            self._transition(item[4], FAILURE, str(e), start_ts, finish_ts)
+        finally:
+            # Whatever happened, the slave's lane must be freed up for its
+            # next piece of work.
+            self._work_done(item)
@@ -0,0 +1,149 @@
+from collections import deque
+
+from gevent.event import Event
+
+# Action name -> priority class. Actions that aren't listed here are in the
+# "default" class.
+action_classes = {
+    "buildslave_uptime": "interactive",
+    "buildslave_last_activity": "interactive",
+    # These can take hours (shutdown_buildslave, and disable which may call
+    # it) or tens of minutes (aws_create_instance) to finish.
+    "shutdown_buildslave": "long",
+    "disable": "long",
+    "aws_create_instance": "long",
+}
+# Priority classes, from highest priority to lowest, and the default share of
+# the Processor's concurrency that work in each one is allowed to use. On top
+# of their shares, the lower priority classes together may only use the slots
+# that aren't reserved for the highest one (see SlaveLanes.configure), which
+# keeps slots free for the quick, interactive actions no matter how much
+# other work is queued.
+priority_classes = [
+    ("interactive", 1.0),
+    ("default", 0.75),
+    ("long", 0.5),
+]
+
+
+def lane_key(slave):
+    """Slaves can be referred to by short name or FQDN, but they should share
+    the same lane either way."""
+    return slave.split(".")[0].lower()
+
+
+def priority_class(item):
+    return action_classes.get(item[4].action, "default")
+
+
+class SlaveLanes(object):
+    """Holds queued work in per-slave lanes. Work for a slave is handed out in
+    the order that it was added, and only after the previous work for that
+    slave is done. Work for different slaves is handed out independently, so
+    a busy slave never holds up any others.
+
+    Across slaves, work in higher priority classes is handed out first, and
+    each class is limited to its share of the total concurrency (see
+    priority_classes).
+
+    Items are the same tuples that the Processor queues up, which have the
+    name of the slave as their first element and the ActionResult as their
+    last."""
+    def __init__(self):
+        # slave -> deque of items not yet handed out
+        self.lanes = {}
+        # class -> slaves whose next item is in that class and which have
+        # nothing running, in the order that they became runnable.
+        self.ready = dict((cls, deque()) for cls, _ in priority_classes)
+        # class -> number of items in that class that are running
+        self.running = dict((cls, 0) for cls, _ in priority_classes)
+        # class -> maximum number of items in that class that may run at once
+        self.limits = {}
+        # Maximum number of items outside the highest priority class that may
+        # run at once.
+        self.shared_limit = 1
+        # Slaves with work currently running.
+        self.busy = set()
+        # Set when there may be work to hand out.
+        self._wakeup = Event()
+        self.configure(1)
+
+    def configure(self, concurrency, shares=None, reserved=1):
+        """Sets the limit of each priority class to its share of
+        "concurrency". "shares" overrides the default share of any classes
+        that it contains. "reserved" slots are kept for work in the highest
+        priority class, although at least one slot is always left for the
+        others."""
+        if shares is None:
+            shares = {}
+        for cls, share in priority_classes:
+            share = shares.get(cls, share)
+            self.limits[cls] = max(1, int(round(concurrency * share)))
+        self.shared_limit = max(1, concurrency - reserved)
+        self.wake()
+
+    def put(self, item):
+        slave = lane_key(item[0])
+        lane = self.lanes.setdefault(slave, deque())
+        lane.append(item)
+        if len(lane) == 1 and slave not in self.busy:
+            self.ready[priority_class(item)].append(slave)
+            self.wake()
+
+    def get(self, block=False, timeout=None):
+        """Returns the next item that can be run, or None if there isn't
+        one. The item's slave is busy until done() is called for it.
+
+        If "block" is True and there is nothing to run, waits up to
+        "timeout" seconds to be woken up by new work (or by wake()) first.
+        None may still be returned after waking up, eg, if another caller
+        got to the new work first."""
+        item = self._next()
+        if item is None and block:
+            self._wakeup.clear()
+            self._wakeup.wait(timeout)
+            item = self._next()
+        return item
+
+    def wake(self):
+        """Wakes up everyone waiting in get()."""
+        self._wakeup.set()
+
+    def _next(self):
+        for cls, _ in priority_classes:
+            if self.ready[cls] and self._has_room(cls):
+                slave = self.ready[cls].popleft()
+                self.busy.add(slave)
+                self.running[cls] += 1
+                return self.lanes[slave].popleft()
+        return None
+
+    def done(self, item):
+        slave = lane_key(item[0])
+        self.running[priority_class(item)] -= 1
+        self.busy.discard(slave)
+        lane = self.lanes[slave]
+        if lane:
+            self.ready[priority_class(lane[0])].append(slave)
+        else:
+            del self.lanes[slave]
+        # This may have freed up the slave, or a slot in a class that was at
+        # its limit.
+        if self.runnable():
+            self.wake()
+
+    def _has_room(self, cls):
+        if self.running[cls] >= self.limits[cls]:
+            return False
+        if cls == priority_classes[0][0]:
+            return True
+        shared = sum(self.running[c] for c, _ in priority_classes[1:])
+        return shared < self.shared_limit
+
+    def runnable(self):
+        """Returns roughly how many items can be handed out right now."""
+        return sum(len(self.ready[cls]) for cls, _ in priority_classes
+                   if self._has_room(cls))
+
+    def qsize(self):
+        return sum(len(lane) for lane in self.lanes.itervalues())
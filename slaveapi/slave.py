@@ -1,16 +1,19 @@
 from bzrest.errors import BugNotFound
 
+from copy import deepcopy
+
 from furl import furl
 
 import socket
 
 from .clients import slavealloc, devices
-from .clients.bugzilla import ProblemTrackingBug, get_reboot_bug
+from .clients.bugzilla import Bug, ProblemTrackingBug, get_reboot_bug
 from .clients.buildapi import get_recent_jobs
 from .clients.ssh import SSHConsole, SSHException
 from .machines.base import Machine
-from .global_state import config
+from .global_state import config, ssh_pool, ssh_credential_cache, facts
 from .util import logException
+from .util.cache import TTLCache
 
 import logging
 log = logging.getLogger(__name__)
@@ -19,88 +22,209 @@ def windows2msys(path_):
     (drive, therest) = path_.split(":")
     return "/" + drive[0] + therest.replace("\\", "/")
 
+class SlaveInfoCache(TTLCache):
+    """Shares what Slaves' load_*_info methods fetch from slavealloc,
+    inventory, Bugzilla and buildapi across requests and actions, so that
+    repeated operations on a slave only go back to those when what we have
+    is older than that source's TTL (see "default_ttls"). Concurrent fetches
+    of something that isn't cached share a single request. Failures aren't
+    cached.
+
+    Actions that change something about a slave must invalidate the sources
+    they changed, eg, disable() invalidates "slavealloc" after updating it."""
+    # Seconds to trust each source for.
+    default_ttls = {
+        "slavealloc": 60,
+        "master": 60 * 60,
+        "inventory": 60 * 60,
+        "bug": 5 * 60,
+        "buildapi": 60,
+    }
+
+    def __init__(self, ttls={}):
+        TTLCache.__init__(self)
+        self.configure(ttls)
+
+    def configure(self, ttls):
+        self.ttls = dict(self.default_ttls)
+        self.ttls.update(ttls)
+
+    def get(self, source, key, fetch, cacheable=None):
+        """Returns what is cached for "key" from "source", or calls "fetch"
+        to get it if nothing fresh is. If "cacheable" is passed, what "fetch"
+        returns is only cached if "cacheable" returns True for it."""
+        ttl = self.ttls[source]
+        if cacheable:
+            return self.get_or_fetch((source, key), fetch,
+                                     lambda value: ttl if cacheable(value) else None)
+        return self.get_or_fetch((source, key), fetch, ttl)
+
+    def invalidate(self, key, *sources):
+        """Forgets what is cached for "key" from each of "sources"."""
+        for source in sources:
+            self.forget((source, key))
+
+info_cache = SlaveInfoCache()
+
 class Slave(Machine):
+    load_timeouts = dict(Machine.load_timeouts, slavealloc=30, bug=30, buildapi=30)
+    lazy_attributes = dict(
+        Machine.lazy_attributes,
+        enabled="load_slavealloc_info",
+        basedir="load_slavealloc_info",
+        notes="load_slavealloc_info",
+        master="load_slavealloc_info",
+        master_url="load_slavealloc_info",
+        bug="load_bug_info",
+        reboot_bug="load_bug_info",
+        recent_jobs="load_recent_job_info",
+    )
+
     def __init__(self, name):
         Machine.__init__(self, name)
-        self.bug = None
-        self.reboot_bug = None
-        self.enabled = None
-        self.basedir = None
-        self.notes = None
-        self.recent_jobs = None
-        self.master = None
-        self.master_url = None
         # used for hosts that have a different machine running buildbot than themselves
         # Valid buildbotslave value is an instance of (or subclass thereof) the Slave class
         self.buildbotslave = None
 
     def load_all_info(self):
-        Machine.load_all_info(self)
-        self.load_slavealloc_info()
-        self.load_bug_info()
-        self.load_recent_job_info()
+        self._load_concurrently({
+            "inventory": self.load_inventory_info,
+            "ipmi": self.load_ipmi_info,
+            "slavealloc": self.load_slavealloc_info,
+            "bug": self.load_bug_info,
+            "buildapi": self.load_recent_job_info,
+        })
 
-    def load_slavealloc_info(self):
+    def load_slavealloc_info(self, fresh=False):
+        """Loads the slave's slavealloc and master information. If "fresh"
+        is True the slave's entry is fetched from slavealloc even if it's
+        cached, which should be done before acting on what it says."""
         log.info("Getting slavealloc info")
-        info = slavealloc.get_slave(config["slavealloc_api_url"], name=self.name)
+        api = config["slavealloc_api_url"]
+        if fresh:
+            info_cache.invalidate(self.name, "slavealloc")
+        info = info_cache.get("slavealloc", self.name,
+                              lambda: slavealloc.get_slave(api, name=self.name))
+        self.enabled = self.basedir = self.notes = None
         if info:  # some slaves might not be in slavealloc. e.g., loans
             self.enabled = info["enabled"]
-            self.basedir = info["basedir"].rstrip("/")
-            # Because we always work with UNIX style paths in SlaveAPI we need
-            # to massage basedir when a Windows style one is detected.
-            if self.basedir[1] == ":":
-                self.basedir = windows2msys(self.basedir)
+            self.basedir = self._get_basedir(info["basedir"].rstrip("/"))
             self.notes = info["notes"]
-        master_info = slavealloc.get_master(config["slavealloc_api_url"], info["current_masterid"])
+        master_info = info_cache.get("master", info["current_masterid"],
+                                     lambda: slavealloc.get_master(api, info["current_masterid"]))
         self.master = master_info.get("fqdn", None)
+        self.master_url = None
         if self.master:
             self.master_url = furl().set(scheme="http", host=self.master, port=master_info["http_port"])
 
+    def _get_basedir(self, basedir):
+        # Because we always work with UNIX style paths in SlaveAPI we need
+        # to massage basedir when a Windows style one is detected. The result
+        # is remembered for as long as slavealloc keeps giving us the same
+        # basedir.
+        known = facts.get(self.name, "basedir")
+        if known and known[0] == basedir:
+            return known[1]
+        converted = basedir
+        if basedir[1] == ":":
+            converted = windows2msys(basedir)
+            # Only Windows slaves have Windows style basedirs.
+            facts.set(self.name, "os", "windows")
+        facts.set(self.name, "basedir", (basedir, converted))
+        return converted
+
     def load_inventory_info(self):
         info = Machine.load_inventory_info(self)
         # Return info to allow subclasses to do stuff with data, without refetching
         return info
 
-    def load_bug_info(self, createIfMissing=False):
+    def _get_inventory_info(self):
+        return info_cache.get("inventory", self.fqdn,
+                              lambda: Machine._get_inventory_info(self))
+
+    def load_bug_info(self, createIfMissing=False, fresh=False):
+        """Loads the slave's problem tracking bug and reboot bug, filing the
+        former if it's missing and "createIfMissing" is True. If "fresh" is
+        True the bugs are fetched from Bugzilla even if they're cached."""
         log.info("Getting bug info")
-        self.bug = ProblemTrackingBug(self.name, loadInfo=False)
-        try:
+        if fresh:
+            info_cache.invalidate(self.name, "bug")
+        # Not having a bug isn't cached, so that we never file a second one
+        # because another request filed one recently. Neither are bugs that
+        # couldn't be fetched properly.
+        cached = info_cache.get("bug", self.name, self._get_bug_info,
+                                cacheable=self._bug_info_complete)
+        self.reboot_bug = None
+        if cached:
+            # Every Slave gets its own copy, so that changes made to one
+            # don't show up in the others.
+            bug_id, bug_data, reboot_bug_id, reboot_bug_data = deepcopy(cached)
+            self.bug = ProblemTrackingBug(self.name, loadInfo=False)
+            self.bug.id_, self.bug.data = bug_id, bug_data
+            if reboot_bug_id:
+                self.reboot_bug = Bug(reboot_bug_id, loadInfo=False)
+                self.reboot_bug.data = reboot_bug_data
+        elif createIfMissing:
+            log.info("Couldn't find bug, creating it...")
+            self.bug = ProblemTrackingBug(self.name, loadInfo=False)
+            self.bug.create()
             self.bug.refresh()
-            self.reboot_bug = get_reboot_bug(self)
+            info_cache.invalidate(self.name, "bug")
+        else:
+            self.bug = None
+
+    def _get_bug_info(self):
+        """Returns the id and data of the slave's problem tracking bug and
+        of its reboot bug (or None and None), or None if the slave has no
+        problem tracking bug."""
+        bug = ProblemTrackingBug(self.name, loadInfo=False)
+        try:
+            bug.refresh()
         except BugNotFound:
-            if createIfMissing:
-                log.info("Couldn't find bug, creating it...")
-                self.bug.create()
-                self.bug.refresh()
-            else:
-                self.bug = None
+            return None
+        # get_reboot_bug() looks for bugs blocking the slave's bug.
+        self.bug = bug
+        reboot_bug = get_reboot_bug(self)
+        if reboot_bug:
+            return bug.id_, bug.data, reboot_bug.id_, reboot_bug.data
+        return bug.id_, bug.data, None, None
+
+    @staticmethod
+    def _bug_info_complete(info):
+        # Bug.refresh() leaves a bug's data empty if fetching it fails.
+        if not info:
+            return False
+        bug_id, bug_data, reboot_bug_id, reboot_bug_data = info
+        return bool(bug_data) and (not reboot_bug_id or bool(reboot_bug_data))
 
     def load_recent_job_info(self, n_jobs=1):
         log.info("Getting recent job info")
-        self.recent_jobs = get_recent_jobs(
-            self.name, config["buildapi_api_url"], n_jobs=n_jobs
+        self.recent_jobs = info_cache.get(
+            "buildapi", (self.name, n_jobs),
+            lambda: get_recent_jobs(self.name, config["buildapi_api_url"], n_jobs=n_jobs)
         )
 
     def to_dict(self):
         """Serializes the state of a Slave. It is up to the caller to ensure that
         any desired information (slavealloc, etc.) is loaded prior to
-        serialization."""
+        serialization. Attributes that haven't been loaded are None."""
 
         data = Machine.to_dict(self)
         data.update({
-            "enabled": self.enabled,
-            "basedir": self.basedir,
-            "notes": self.notes,
+            "enabled": self._get_loaded("enabled"),
+            "basedir": self._get_loaded("basedir"),
+            "notes": self._get_loaded("notes"),
             "bug": None,
             "recent_jobs": None,
             "buildbotslave": None,
         })
-        if self.recent_jobs:
+        if self._get_loaded("recent_jobs"):
             data["recent_jobs"] = self.recent_jobs
-        if self.bug and self.bug.data:
+        bug = self._get_loaded("bug")
+        if bug and bug.data:
             data["bug"] = {
-                "id": self.bug.id_,
-                "is_open": self.bug.data["is_open"]
+                "id": bug.id_,
+                "is_open": bug.data["is_open"]
             }
         if self.buildbotslave:
             data["buildbotslave"] = self.buildbotslave.to_dict()
@@ -117,7 +241,9 @@ def get_console(slave, usebuildbotslave=False):
         # slave.basedir is still accurate, though.
         realslave = slave.buildbotslave or slave
 
-    console = SSHConsole(realslave.ip, config["ssh_credentials"])
+    console = SSHConsole(realslave.ip, config["ssh_credentials"], pool=ssh_pool,
+                         name=realslave.name, credential_cache=ssh_credential_cache,
+                         max_output_size=config["ssh_max_output_size"], facts=facts)
     try:
         console.connect()  # Make sure we can connect properly
         return console
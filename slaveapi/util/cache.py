@@ -0,0 +1,96 @@
+import time
+
+from gevent import spawn
+from gevent.event import AsyncResult
+
+from . import logException
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class TTLCache(object):
+    """Holds values for a limited time, fetching them again once they've
+    expired. Concurrent lookups of a key that isn't cached share a single
+    fetch. "hits", "misses" and "coalesced" count lookups that were
+    answered from the cache, that needed a fetch, and that waited on another
+    lookup's fetch."""
+    # Expired entries are only cleared out once there are this many.
+    max_entries = 10000
+
+    def __init__(self):
+        # key -> (value, time it was stored, expiration time)
+        self._cache = {}
+        # key -> AsyncResult for a fetch that is in progress
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get_or_fetch(self, key, fetch, ttl, refresh_after=None):
+        """Returns the value cached for "key", or calls "fetch" to get it if
+        there isn't a fresh one. "ttl" is how many seconds to keep what
+        "fetch" returns for, or a function that takes that value and returns
+        how long to keep it, or None to not keep it at all. Exceptions raised
+        by "fetch" (including a Timeout that interrupts it) are passed on to
+        every lookup that was waiting on it, and never cached.
+
+        If "refresh_after" is given, a cached value that is older than that
+        fraction of its TTL is still returned, but is also fetched again in
+        the background."""
+        now = time.time()
+        cached = self._cache.get(key)
+        if cached and cached[2] > now:
+            value, stored_at, expires = cached
+            self.hits += 1
+            if (refresh_after is not None and key not in self._pending and
+                    now - stored_at > (expires - stored_at) * refresh_after):
+                # Marked as pending right away, so that lookups before the
+                # refresh gets going don't start refreshes of their own.
+                self._pending[key] = AsyncResult()
+                spawn(self._refresh, key, fetch, ttl)
+            return value
+        pending = self._pending.get(key)
+        if pending:
+            self.coalesced += 1
+            return pending.get()
+
+        self.misses += 1
+        self._pending[key] = AsyncResult()
+        return self._fetch(key, fetch, ttl)
+
+    def forget(self, key):
+        self._cache.pop(key, None)
+
+    def _fetch(self, key, fetch, ttl):
+        pending = self._pending[key]
+        try:
+            try:
+                value = fetch()
+            except BaseException, e:
+                # This includes Timeouts and the greenlet being killed, which
+                # would otherwise leave any lookups waiting on us hanging.
+                pending.set_exception(e)
+                raise
+            if callable(ttl):
+                ttl = ttl(value)
+            if ttl is not None:
+                self._store(key, value, ttl)
+            pending.set(value)
+            return value
+        finally:
+            del self._pending[key]
+
+    def _refresh(self, key, fetch, ttl):
+        try:
+            self._fetch(key, fetch, ttl)
+        except:
+            logException(log.warning, "Couldn't refresh %s" % (key,))
+
+    def _store(self, key, value, ttl):
+        now = time.time()
+        if len(self._cache) >= self.max_entries:
+            for k, (_, _, expires) in self._cache.items():
+                if expires <= now:
+                    del self._cache[k]
+        self._cache[key] = (value, now, now + ttl)
@@ -4,19 +4,38 @@ from flask import jsonify, make_response, request, Response
 from flask.views import MethodView
 
 from ..global_state import processor, results
+from ..util import normalize_truthiness
 
 log = logging.getLogger(__name__)
 
 
-def missing_fields_response(fields_received):
+class ActionArgumentError(Exception):
+    """Raised by :py:meth:`ActionView.get_action_kwargs` when a request has
+    missing or invalid arguments for an action."""
+    def __init__(self, error, msg):
+        self.error = error
+        self.msg = msg
+        Exception.__init__(self, error, msg)
+
+    def to_response(self):
+        return make_response(
+            jsonify({'error': self.error, 'msg': self.msg}), 400
+        )
+
+
+def missing_fields_error(fields_received):
     unmet_fields_msg = 'Fields received: '
     for key, val in fields_received.iteritems():
         unmet_fields_msg += '`%s`: %s, ' % (key, val or 'None')
-    return make_response(
-        jsonify({'error': 'Missing required fields for this action',
-                 'msg': unmet_fields_msg
-        }), 400
-    )
+    return ActionArgumentError('Missing required fields for this action',
+                               unmet_fields_msg)
+
+
+def get_coalesce():
+    try:
+        return normalize_truthiness(request.form.get("coalesce", True))
+    except ValueError as e:
+        raise ActionArgumentError('incorrect args for coalesce in post', str(e))
 
 
 class ActionView(MethodView):
@@ -26,9 +45,11 @@ class ActionView(MethodView):
     than as a class attribute, otherwise Python will turn it into a class
     method and pass along "self" to the action -- which actions don't generally
     expect. If the action requires extra arguments (eg, arguments
-    sent through POST data), the subclass should override the "post" method
-    and pass them to it."""
+    sent through POST data), the subclass should override the
+    "get_action_kwargs" method and return them from it."""
     action = NotImplementedError
+    # Longest time (in seconds) that a GET may wait for a state change.
+    max_wait = 300
 
     def get(self, slave):
         """Retrieve results from an action.
@@ -40,6 +61,12 @@ class ActionView(MethodView):
             requestid (int): If specified, returns only the results for this \
                 specific previous action.. If not passed, results from all \
                 previous actions of this type are returned.
+            wait (int): Only used with requestid. If specified, waits up to \
+                this many seconds (at most 300) for the state of the action \
+                to change before returning.
+            state (int): Only used with wait. The state that the caller last \
+                saw the action in. Returns right away if the action is no \
+                longer in this state. Defaults to the current state.
 
         Returns:
             The status of the request specified or the status of all previous
@@ -51,18 +78,35 @@ class ActionView(MethodView):
             if requestid:
                 requestid = int(requestid)
                 log.debug("Got requestid: %s", requestid)
-        except TypeError:
+        except ValueError:
             return Response(response="Couldn't parse requestid", status=400)
-
-        res = results[slave][self.action.__name__].get(requestid, None)
+        try:
+            wait = min(int(request.args.get("wait", 0)), self.max_wait)
+            state = request.args.get("state", None)
+            if state is not None:
+                state = int(state)
+        except ValueError:
+            return Response(response="Couldn't parse wait or state", status=400)
+
+        res = results.get(slave, self.action.__name__, requestid)
         if res:
+            if wait and not res.is_done():
+                if state is None:
+                    state = res.state
+                res.wait_for_change(state, wait)
             return jsonify(res.to_dict())
         else:
             action_results = {}
-            for id_, res in results[slave][self.action.__name__].iteritems():
+            for id_, res in results.get_action_results(slave, self.action.__name__).iteritems():
                 action_results[id_] = res.to_dict()
             return jsonify({self.action.__name__: action_results})
 
+    def get_action_kwargs(self):
+        """Returns the keyword arguments to pass to the action, parsed from
+        the POST data of the current request. Raises ActionArgumentError if
+        they are missing or invalid."""
+        return {}
+
     def post(self, slave, *action_args, **action_kwargs):
         """Request an action of a slave.
 
@@ -73,14 +117,23 @@ class ActionView(MethodView):
             waittime: How long to wait (in seconds) for the action to complete before \
                 returning a requestid to the user and continuing the work in \
                 the background.
+            coalesce: If true (the default) and the same action with the same \
+                arguments is already pending or running for this slave, the \
+                status and requestid of that action are returned instead of \
+                starting a new one. Pass "false" to always start a new one.
 
         Returns:
             The status of the action, after waiting `waittime` for it to
             complete. See :py:func:`slaveapi.actions.results.ActionResult.to_dict`
             for details on what status looks like.
         """
-        res = processor.add_work(slave, self.action, *action_args, **action_kwargs)
-        results[slave][self.action.__name__][res.id_] = res
+        try:
+            action_kwargs.update(self.get_action_kwargs())
+            coalesce = get_coalesce()
+        except ActionArgumentError as e:
+            return e.to_response()
+        res = processor.submit(slave, self.action, action_args, action_kwargs,
+                               coalesce=coalesce)
 
         # Wait for the action to complete if requested.
         waittime = int(request.form.get("waittime", 0))
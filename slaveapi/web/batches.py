@@ -0,0 +1,107 @@
+import logging
+
+from flask import jsonify, make_response, request, Response
+from flask.views import MethodView
+
+from .action_base import ActionArgumentError, get_coalesce
+from .slave import action_views
+from ..actions.results import Batch
+from ..clients.slavealloc import get_slaves
+from ..global_state import batches, config, processor
+from ..util import normalize_truthiness
+
+log = logging.getLogger(__name__)
+
+
+class Batches(MethodView):
+    """Requests an action for many slaves at once, and reports on its
+    progress."""
+    def get(self, batchid):
+        """Returns the progress of a previously requested batch.
+
+        URL Args:
+            batchid (int): The batch to return progress for.
+
+        Returns:
+            See :py:func:`slaveapi.actions.results.Batch.to_dict` for details
+            on what progress looks like.
+        """
+        batch = batches.get(batchid)
+        if not batch:
+            return Response(response="No such batchid", status=404)
+        return jsonify(batch.to_dict())
+
+    def post(self):
+        """Requests an action for a list of slaves, or for all of the slaves
+        that match a Slavealloc filter. Any arguments that the action accepts
+        on its own endpoint (eg, "reason" for disable) may be passed as well,
+        and are used for every slave.
+
+        POST Args:
+            action (str): The action to request, named as it is in the URL \\
+                of its own endpoint (eg, "reboot" or "get_uptime").
+            slaves (str): A slave to request the action for. May be passed \\
+                more than once. Slaves that are passed more than once only \\
+                get one request, and are listed in "duplicates".
+            purpose, environment, pool, enabled: If no slaves are passed, \\
+                the action is requested for every slave that Slavealloc \\
+                returns for these. "enabled" takes the same values as \\
+                "coalesce". See :py:class:`slaveapi.web.slaves.Slaves` for \\
+                details.
+            coalesce: See :py:meth:`slaveapi.web.action_base.ActionView.post`.
+
+        Returns:
+            The progress of the new batch. See
+            :py:func:`slaveapi.actions.results.Batch.to_dict` for details on
+            what progress looks like. Progress can be retrieved later from
+            /batches/:batchid.
+        """
+        view_class = action_views.get(request.form.get("action"))
+        if not view_class:
+            return make_response(
+                jsonify({'error': 'Unknown action',
+                         'msg': 'Expected one of: %s' % sorted(action_views)}),
+                400
+            )
+        view = view_class()
+        try:
+            action_kwargs = view.get_action_kwargs()
+            coalesce = get_coalesce()
+        except ActionArgumentError as e:
+            return e.to_response()
+
+        slaves = request.form.getlist("slaves")
+        if not slaves:
+            purpose = request.form.getlist("purpose")
+            environment = request.form.getlist("environment")
+            pool = request.form.getlist("pool")
+            if purpose or environment or pool:
+                enabled = request.form.get("enabled", None)
+                if enabled is not None:
+                    try:
+                        enabled = "1" if normalize_truthiness(enabled) else "0"
+                    except ValueError as e:
+                        return ActionArgumentError('incorrect args for enabled in post',
+                                                   str(e)).to_response()
+                slaves = [s["name"] for s in get_slaves(
+                    config["slavealloc_api_url"], purpose, environment, pool,
+                    enabled)]
+        if not slaves:
+            return make_response(
+                jsonify({'error': 'No slaves to request the action for',
+                         'msg': 'Pass "slaves" or a Slavealloc filter that '
+                                'matches at least one slave.'}),
+                400
+            )
+
+        batch = Batch(view.action.__name__)
+        for slave in slaves:
+            if slave in batch.results:
+                batch.add_duplicate(slave)
+                continue
+            batch.add(processor.submit(slave, view.action, (), action_kwargs,
+                                       coalesce=coalesce))
+        batches.add(batch)
+        log.info("Requested %s for %d slaves in batch %s", batch.action,
+                 len(batch.results), batch.id_)
+        return make_response(jsonify(batch.to_dict()), 202)
@@ -0,0 +1,86 @@
+import json
+import logging
+
+from flask import request, Response
+from flask.views import MethodView
+from gevent import queue
+
+from ..actions.results import SUCCESS, FAILURE
+from ..global_state import messenger, results
+
+log = logging.getLogger(__name__)
+
+
+def format_event(event):
+    return "data: %s\n\n" % json.dumps(event)
+
+
+class Events(MethodView):
+    """Streams ActionResult state changes as Server-Sent Events."""
+    # Seconds between keepalive comments on an otherwise idle stream.
+    keepalive = 15
+
+    def get(self):
+        """Streams state changes of ActionResults. Each event's data is a
+        JSON object in the format of
+        :py:func:`slaveapi.actions.results.ActionResult.to_dict` with
+        "requestid", "slave", and "action" included. If no query args are
+        passed, changes to all results are streamed.
+
+        Query Args:
+            requestid (int): Only stream changes for this request. Its \\
+                current state is sent right away, and the stream ends once \\
+                it is finished.
+            slave (str): Only stream changes for this slave.
+            action (str): Only stream changes for this action.
+        """
+        slave = request.args.get("slave", None)
+        action = request.args.get("action", None)
+        try:
+            requestid = request.args.get("requestid", None)
+            if requestid:
+                requestid = int(requestid)
+        except ValueError:
+            return Response(response="Couldn't parse requestid", status=400)
+        res = None
+        if requestid:
+            res = results.find(requestid)
+            if res is None:
+                return Response(response="No such requestid", status=404)
+
+        def matches(event):
+            if requestid and event["requestid"] != requestid:
+                return False
+            if slave and event["slave"] != slave:
+                return False
+            if action and event["action"] != action:
+                return False
+            return True
+
+        def stream():
+            events = queue.Queue()
+            messenger.subscribe(events.put)
+            try:
+                # Subscribing first means that nothing can be missed between
+                # sending the current state and the first batch of events.
+                if res:
+                    yield format_event(res.to_event())
+                    if res.is_done():
+                        return
+                while True:
+                    try:
+                        batch = events.get(timeout=self.keepalive)
+                    except queue.Empty:
+                        yield ": keepalive\n\n"
+                        continue
+                    for event in batch:
+                        if not matches(event):
+                            continue
+                        yield format_event(event)
+                        if requestid and event["state"] in (SUCCESS, FAILURE):
+                            return
+            finally:
+                messenger.unsubscribe(events.put)
+
+        return Response(stream(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache"})
@@ -1,4 +1,6 @@
-from flask import jsonify
+import json
+
+from flask import jsonify, request, Response
 from flask.views import MethodView
 
 from ..actions.results import dictify_results
@@ -7,12 +9,86 @@ from ..global_state import results
 
 class Results(MethodView):
     """Provides results from previously requested actions."""
+    # Page size for NDJSON responses when "limit" isn't passed.
+    default_ndjson_limit = 1000
+    # Largest page size that can be asked for.
+    max_limit = 10000
+    # Most results to look at for a page of results, so that filtering a
+    # long history stays cheap even when few results match.
+    max_scan = 10000
+
     def get(self):
-        """Returns all results from all previously requested actions in JSON
-        format.
+        """Returns results from previously requested actions, oldest request
+        first. By default, all results are returned as one JSON object.
+
+        Query Args:
+            since (float): Only return results that changed state at or \\
+                after this timestamp.
+            state (int): Only return results in this state. May be passed \\
+                more than once.
+            slave (str): Only return results for this slave.
+            action (str): Only return results for this action.
+            limit (int): Return at most this many results. Must be at \\
+                least 1, and larger values than 10000 are treated as 10000. \\
+                If more results may be available, the "X-Next-Cursor" \\
+                response header is set to the value to pass as "cursor" to \\
+                get the next page. When few results match, a page may have \\
+                fewer than "limit" results (or none) and still be followed \\
+                by more pages.
+            cursor (int): Carry on from where the previous page left off, \\
+                by passing its "X-Next-Cursor".
+            format (str): Pass "ndjson" to stream newline delimited JSON, \\
+                with one result per line, instead. Pages default to 1000 \\
+                results in this format.
 
         Returns:
             See :py:func:`slaveapi.actions.results.dictify_results` for
-            details on the format of the returned data.
+            details on the format of the returned data. Lines of NDJSON
+            output are in the format of
+            :py:func:`slaveapi.actions.results.ActionResult.to_dict`, with
+            "requestid", "slave", and "action" included.
         """
-        return jsonify(dictify_results(results))
+        ndjson = request.args.get("format", None) == "ndjson"
+        slave = request.args.get("slave", None)
+        action = request.args.get("action", None)
+        try:
+            since = request.args.get("since", None, type=float)
+            states = [int(s) for s in request.args.getlist("state")]
+            cursor = request.args.get("cursor", None, type=int)
+            limit = request.args.get("limit", None)
+            if limit is not None:
+                limit = int(limit)
+        except ValueError:
+            return Response(response="Couldn't parse query args", status=400)
+        if limit is not None:
+            if limit < 1:
+                return Response(response="limit must be at least 1", status=400)
+            limit = min(limit, self.max_limit)
+        if ndjson and limit is None:
+            limit = self.default_ndjson_limit
+
+        def predicate(res):
+            if action and res.action != action:
+                return False
+            if states and res.state not in states:
+                return False
+            if since is not None and res.last_update < since:
+                return False
+            return True
+
+        # Only paged requests are limited in how much they look at, others
+        # get everything that matches.
+        max_scan = self.max_scan if limit is not None else None
+        page, next_cursor = results.select(after=cursor, limit=limit, predicate=predicate,
+                                           slave=slave or None, max_scan=max_scan)
+
+        if ndjson:
+            def stream():
+                for res in page:
+                    yield json.dumps(res.to_event()) + "\n"
+            response = Response(stream(), mimetype="application/x-ndjson")
+        else:
+            response = jsonify(dictify_results(page))
+        if next_cursor is not None:
+            response.headers["X-Next-Cursor"] = str(next_cursor)
+        return response
@@ -1,9 +1,9 @@
 import logging
 
-from flask import jsonify, request, make_response
+from flask import jsonify, request
 from flask.views import MethodView
 
-from .action_base import ActionView, missing_fields_response
+from .action_base import ActionView, ActionArgumentError, missing_fields_error
 from ..actions.reboot import reboot
 from ..actions.shutdown_buildslave import shutdown_buildslave
 from ..actions.buildslave_uptime import buildslave_uptime
@@ -74,18 +74,14 @@ class Disable(ActionView):
         self.action = disable
         ActionView.__init__(self, *args, **kwargs)
 
-    def post(self, slave, *args, **kwargs):
+    def get_action_kwargs(self):
         reason = request.form.get('reason')
         try:
             force = normalize_truthiness(request.form.get('force', False))
         except ValueError as e:
-            return make_response(
-                jsonify({'error': 'incorrect args for use_force in post',
-                         'msg': str(e)}),
-                400
-            )
-        return super(Disable, self).post(slave, *args, force=force,
-                                         reason=reason, **kwargs)
+            raise ActionArgumentError('incorrect args for use_force in post',
+                                      str(e))
+        return {'force': force, 'reason': reason}
 
 
 class AWSCreateInstance(ActionView):
@@ -98,7 +94,7 @@ class AWSCreateInstance(ActionView):
         self.action = aws_create_instance
         ActionView.__init__(self, *args, **kwargs)
 
-    def post(self, slave, *args, **kwargs):
+    def get_action_kwargs(self):
         required_fields = {
             'email': request.form.get('email'),
             'bug': request.form.get('bug'),
@@ -110,34 +106,30 @@ class AWSCreateInstance(ActionView):
         }
 
         if not all(required_fields.values()):
-            return missing_fields_response(required_fields)
+            raise missing_fields_error(required_fields)
 
         if not value_in_values(required_fields['instance_type'],
                                ['build', 'test']):
-            return make_response(
-                jsonify(
-                    {'error': 'incorrect arg for instance_type in post',
-                     'msg': 'Got: %s, expected: %s' % (
-                         required_fields['instance_type'], ['build', 'test'])}
-                ), 400
+            raise ActionArgumentError(
+                'incorrect arg for instance_type in post',
+                'Got: %s, expected: %s' % (
+                    required_fields['instance_type'], ['build', 'test'])
             )
 
         if (required_fields['instance_type'] == 'build' and
                 optional_fields == '32'):
-            return make_response(
-                jsonify(
-                    {'error': 'mismatching instance_type and arch',
-                     'msg': '32bit instances are not used for building'}
-                ), 400
+            raise ActionArgumentError(
+                'mismatching instance_type and arch',
+                '32bit instances are not used for building'
             )
 
-        return super(AWSCreateInstance, self).post(
-            slave, *args, email=required_fields['email'],
-            bug=required_fields['bug'],
-            instance_type=required_fields['instance_type'],
-            arch=optional_fields['arch'], disambig=optional_fields['disambig'],
-            **kwargs
-        )
+        return {
+            'email': required_fields['email'],
+            'bug': required_fields['bug'],
+            'instance_type': required_fields['instance_type'],
+            'arch': optional_fields['arch'],
+            'disambig': optional_fields['disambig'],
+        }
 
 class AWSTerminateInstance(ActionView):
     """Terminate aws instance if it exists.
@@ -167,3 +159,21 @@ class AWSStartInstance(ActionView):
     def __init__(self, *args, **kwargs):
         self.action = aws_start_instance
         ActionView.__init__(self, *args, **kwargs)
+
+
+# Actions, as named in their URLs (/slaves/<slave>/actions/<name>), and the
+# endpoints and views that handle them. slaveapi.web registers a URL for each
+# of these, and /batches accepts the same names.
+actions = [
+    ("reboot", "reboot", Reboot),
+    ("get_uptime", "get_uptime", GetUptime),
+    ("get_last_activity", "get_last_activity", GetLastActivity),
+    ("shutdown_buildslave", "shutdown_buildslave", ShutdownBuildslave),
+    ("disable", "disable", Disable),
+    ("aws_create_instance", "aws_create_instance", AWSCreateInstance),
+    ("terminate", "aws_terminate_instance", AWSTerminateInstance),
+    ("start", "aws_start_instance", AWSStartInstance),
+    ("stop", "aws_stop_instance", AWSStopInstance),
+]
+# Action names, as used in URLs, -> the views that handle them.
+action_views = dict((name, view) for name, _, view in actions)
@@ -0,0 +1,112 @@
+import time
+import unittest
+
+import gevent
+
+from slaveapi.util.cache import TTLCache
+
+
+class Fetcher(object):
+    """Counts fetches, each of which takes "delay" seconds."""
+    def __init__(self, value="value", delay=0):
+        self.value = value
+        self.delay = delay
+        self.fetches = 0
+
+    def __call__(self):
+        self.fetches += 1
+        gevent.sleep(self.delay)
+        if isinstance(self.value, Exception):
+            raise self.value
+        return self.value
+
+
+class TestTTLCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = TTLCache()
+
+    def testValuesAreCachedUntilTheyExpire(self):
+        fetch = Fetcher()
+        self.assertEqual(self.cache.get_or_fetch("key", fetch, 0.1), "value")
+        self.assertEqual(self.cache.get_or_fetch("key", fetch, 0.1), "value")
+        self.assertEqual(fetch.fetches, 1)
+        time.sleep(0.15)
+        self.cache.get_or_fetch("key", fetch, 0.1)
+        self.assertEqual(fetch.fetches, 2)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def testConcurrentLookupsShareAFetch(self):
+        fetch = Fetcher(delay=0.05)
+        lookups = [gevent.spawn(self.cache.get_or_fetch, "key", fetch, 60) for _ in range(5)]
+        gevent.joinall(lookups)
+        self.assertEqual([g.value for g in lookups], ["value"] * 5)
+        self.assertEqual(fetch.fetches, 1)
+        self.assertEqual(self.cache.coalesced, 4)
+
+    def testFailuresAreSharedButNotCached(self):
+        fetch = Fetcher(ValueError("broken"), delay=0.05)
+        def lookup():
+            try:
+                self.cache.get_or_fetch("key", fetch, 60)
+            except ValueError, e:
+                return e
+        lookups = [gevent.spawn(lookup) for _ in range(2)]
+        gevent.joinall(lookups)
+        self.assertTrue(all(isinstance(g.value, ValueError) for g in lookups))
+        self.assertRaises(ValueError, self.cache.get_or_fetch, "key", fetch, 60)
+        self.assertEqual(fetch.fetches, 2)
+
+    def testTimedOutFetchesDontLeaveLookupsWaiting(self):
+        fetch = Fetcher(delay=1)
+        def timed_lookup():
+            try:
+                with gevent.Timeout(0.05):
+                    self.cache.get_or_fetch("key", fetch, 60)
+            except gevent.Timeout, e:
+                return e
+        def lookup():
+            try:
+                return self.cache.get_or_fetch("key", fetch, 60)
+            except gevent.Timeout, e:
+                return e
+        first = gevent.spawn(timed_lookup)
+        gevent.sleep(0)
+        second = gevent.spawn(lookup)
+        # The second lookup must finish once the first one's fetch is
+        # interrupted, long before the fetch itself would have.
+        gevent.joinall([first, second], timeout=0.5)
+        self.assertTrue(second.ready())
+        self.assertTrue(isinstance(second.value, gevent.Timeout))
+        self.assertEqual(self.cache._pending, {})
+        fetch.delay = 0
+        self.assertEqual(self.cache.get_or_fetch("key", fetch, 60), "value")
+
+    def testTTLCanDependOnTheValue(self):
+        fetch = Fetcher(None)
+        ttl = lambda value: None if value is None else 60
+        self.cache.get_or_fetch("key", fetch, ttl)
+        self.cache.get_or_fetch("key", fetch, ttl)
+        self.assertEqual(fetch.fetches, 2)
+        fetch.value = "value"
+        self.cache.get_or_fetch("key", fetch, ttl)
+        self.cache.get_or_fetch("key", fetch, ttl)
+        self.assertEqual(fetch.fetches, 3)
+
+    def testOldValuesAreRefreshedOnceInTheBackground(self):
+        fetch = Fetcher(delay=0.05)
+        self.cache.get_or_fetch("key", fetch, 0.2, refresh_after=0.5)
+        time.sleep(0.15)
+        fetch.value = "new value"
+        for _ in range(5):
+            # The old value is still good enough to return right away.
+            self.assertEqual(self.cache.get_or_fetch("key", fetch, 0.2, refresh_after=0.5), "value")
+        gevent.sleep(0.1)
+        self.assertEqual(fetch.fetches, 2)
+        self.assertEqual(self.cache.get_or_fetch("key", fetch, 0.2, refresh_after=0.5), "new value")
+
+    def testForget(self):
+        fetch = Fetcher()
+        self.cache.get_or_fetch("key", fetch, 60)
+        self.cache.forget("key")
+        self.cache.get_or_fetch("key", fetch, 60)
+        self.assertEqual(fetch.fetches, 2)
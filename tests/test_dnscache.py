@@ -0,0 +1,91 @@
+import time
+import unittest
+
+import gevent
+from dns import resolver
+
+from slaveapi.clients import dnscache
+from slaveapi.clients.dnscache import DNSCache
+
+
+class Answer(object):
+    def __init__(self, name, ttl):
+        self.name = name
+        self.expiration = time.time() + ttl
+
+
+class FakeResolver(object):
+    """Answers queries from "records", a dict of name -> TTL, and raises
+    NXDOMAIN for anything else."""
+    NXDOMAIN = resolver.NXDOMAIN
+
+    def __init__(self, records):
+        self.records = records
+        self.queries = []
+
+    def query(self, name, rdtype):
+        self.queries.append((name, rdtype))
+        gevent.sleep(0.01)
+        if name not in self.records:
+            raise resolver.NXDOMAIN()
+        return Answer(name, self.records[name])
+
+
+class TestDNSCache(unittest.TestCase):
+    def setUp(self):
+        self.resolver = FakeResolver({"slave1.build.mozilla.org": 60,
+                                      "short.build.mozilla.org": 0.1})
+        self._saved = dnscache.resolver
+        dnscache.resolver = self.resolver
+        self.cache = DNSCache(negative_ttl=0.1, max_ttl=3600)
+
+    def tearDown(self):
+        dnscache.resolver = self._saved
+
+    def testAnswersAreCachedForTheirTTL(self):
+        answer = self.cache.query("slave1.build.mozilla.org")
+        self.assertTrue(self.cache.query("slave1.build.mozilla.org") is answer)
+        self.cache.query("short.build.mozilla.org")
+        time.sleep(0.15)
+        self.cache.query("short.build.mozilla.org")
+        self.assertEqual(len(self.resolver.queries), 3)
+
+    def testTTLsAreCapped(self):
+        self.cache.max_ttl = 0.1
+        self.cache.query("slave1.build.mozilla.org")
+        time.sleep(0.15)
+        self.cache.query("slave1.build.mozilla.org")
+        self.assertEqual(len(self.resolver.queries), 2)
+
+    def testNamesAreCaseAndDotInsensitive(self):
+        self.cache.query("slave1.build.mozilla.org")
+        self.cache.query("SLAVE1.build.mozilla.org.")
+        self.assertEqual(len(self.resolver.queries), 1)
+
+    def testRecordTypesAreCachedSeparately(self):
+        self.cache.query("slave1.build.mozilla.org", "A")
+        self.cache.query("slave1.build.mozilla.org", "PTR")
+        self.assertEqual(len(self.resolver.queries), 2)
+
+    def testMissingNamesAreCachedForNegativeTTL(self):
+        for _ in range(2):
+            self.assertRaises(resolver.NXDOMAIN, self.cache.query, "missing.build.mozilla.org")
+        self.assertEqual(len(self.resolver.queries), 1)
+        time.sleep(0.15)
+        self.assertRaises(resolver.NXDOMAIN, self.cache.query, "missing.build.mozilla.org")
+        self.assertEqual(len(self.resolver.queries), 2)
+
+    def testOtherFailuresAreNotCached(self):
+        def timeout(name, rdtype):
+            self.resolver.queries.append((name, rdtype))
+            raise resolver.Timeout()
+        self.resolver.query = timeout
+        for _ in range(2):
+            self.assertRaises(resolver.Timeout, self.cache.query, "slave1.build.mozilla.org")
+        self.assertEqual(len(self.resolver.queries), 2)
+
+    def testConcurrentLookupsShareAQuery(self):
+        lookups = [gevent.spawn(self.cache.query, "slave1.build.mozilla.org") for _ in range(5)]
+        gevent.joinall(lookups)
+        self.assertEqual(len(set(id(g.value) for g in lookups)), 1)
+        self.assertEqual(len(self.resolver.queries), 1)
@@ -0,0 +1,82 @@
+from subprocess import CalledProcessError
+import time
+import unittest
+
+import gevent
+
+from slaveapi.clients import ipmi
+from slaveapi.clients.ipmi import IPMICapabilityCache, IPMIInterface
+
+
+class FakeIPMIInterface(IPMIInterface):
+    """Answers "mc info" according to "hosts", a dict of fqdn -> whether
+    its interface works, and counts how often that was asked."""
+    hosts = {}
+    probes = []
+
+    def run_cmd(self, cmd):
+        self.probes.append(self.fqdn)
+        gevent.sleep(0.01)
+        works = self.hosts[self.fqdn]
+        if isinstance(works, Exception):
+            raise works
+        if not works:
+            raise CalledProcessError(1, "ipmitool", "Unable to establish session")
+        return ""
+
+
+class TestIPMICapabilityCache(unittest.TestCase):
+    def setUp(self):
+        FakeIPMIInterface.hosts = {"good-mgmt": True, "bad-mgmt": False}
+        FakeIPMIInterface.probes = []
+        self._saved = ipmi.IPMIInterface
+        ipmi.IPMIInterface = FakeIPMIInterface
+        self.cache = IPMICapabilityCache(positive_ttl=60, negative_ttl=60)
+
+    def tearDown(self):
+        ipmi.IPMIInterface = self._saved
+
+    def get(self, fqdn):
+        return self.cache.get_interface(fqdn, "user", "password")
+
+    def testAnswersAreCached(self):
+        for _ in range(2):
+            interface = self.get("good-mgmt")
+            self.assertEqual((interface.fqdn, interface.username), ("good-mgmt", "user"))
+            self.assertEqual(self.get("bad-mgmt"), None)
+        self.assertEqual(FakeIPMIInterface.probes, ["good-mgmt", "bad-mgmt"])
+
+    def testFailingToRunIPMIToolIsNotCached(self):
+        FakeIPMIInterface.hosts["good-mgmt"] = OSError("No such file or directory")
+        self.assertRaises(OSError, self.get, "good-mgmt")
+        FakeIPMIInterface.hosts["good-mgmt"] = True
+        self.assertTrue(self.get("good-mgmt"))
+        self.assertEqual(len(FakeIPMIInterface.probes), 2)
+
+    def testInvalidate(self):
+        self.get("good-mgmt")
+        FakeIPMIInterface.hosts["good-mgmt"] = False
+        self.cache.invalidate("good-mgmt")
+        self.assertEqual(self.get("good-mgmt"), None)
+        self.assertEqual(len(FakeIPMIInterface.probes), 2)
+
+    def testAgeingAnswersAreReverifiedOnceInTheBackground(self):
+        self.cache.positive_ttl = 0.2
+        self.get("good-mgmt")
+        time.sleep(0.15)
+        FakeIPMIInterface.hosts["good-mgmt"] = False
+        # What we knew is still used while it's being checked again.
+        for _ in range(5):
+            self.assertTrue(self.get("good-mgmt"))
+        gevent.sleep(0.05)
+        self.assertEqual(FakeIPMIInterface.probes, ["good-mgmt", "good-mgmt"])
+        self.assertEqual(self.get("good-mgmt"), None)
+
+    def testTTLsDependOnTheAnswer(self):
+        self.cache.negative_ttl = 0.1
+        self.get("good-mgmt")
+        self.get("bad-mgmt")
+        time.sleep(0.15)
+        self.get("good-mgmt")
+        self.get("bad-mgmt")
+        self.assertEqual(FakeIPMIInterface.probes, ["good-mgmt", "bad-mgmt", "bad-mgmt"])
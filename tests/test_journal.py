@@ -0,0 +1,145 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import gevent
+from gevent.monkey import get_original
+from gevent.queue import Queue
+
+import slaveapi.global_state
+from slaveapi import journal as journal_module
+from slaveapi import processor as processor_module
+from slaveapi.actions.results import ActionResult, ResultStore, PENDING, RUNNING, SUCCESS, FAILURE
+from slaveapi.journal import Journal
+from slaveapi.processor import Processor
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "slaveapi.journal")
+        self.results = ResultStore()
+        self.messages = Queue()
+        self._saved = processor_module.results, processor_module.messages
+        processor_module.results = self.results
+        processor_module.messages = self.messages
+        self.journal = Journal()
+
+    def tearDown(self):
+        self.journal.close()
+        processor_module.results, processor_module.messages = self._saved
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, records):
+        with open(self.path, "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+    def read(self):
+        return [json.loads(line) for line in open(self.path)]
+
+    def enqueue(self, requestid):
+        return {"type": "enqueue", "requestid": requestid, "slave": "slave%d" % requestid,
+                "action": "buildslave_uptime", "args": [], "kwargs": {},
+                "request_timestamp": time.time()}
+
+    def state(self, requestid, state):
+        return {"type": "state", "requestid": requestid, "state": state, "text": "",
+                "start_timestamp": time.time(), "finish_timestamp": time.time()}
+
+    def restore(self):
+        entries = self.journal.open(self.path, self.results, sync_interval=60)
+        Processor().restore(entries)
+        self.journal.compact()
+        return entries
+
+    def testLatestStateOfEachRequestIsRestored(self):
+        self.write([self.enqueue(1), self.state(1, RUNNING), self.state(1, SUCCESS),
+                    self.enqueue(2), self.state(2, RUNNING), self.enqueue(3)])
+        self.restore()
+        self.assertEqual([(res.id_, res.state) for res in sorted(self.results, key=lambda r: r.id_)],
+                         [(1, SUCCESS), (2, FAILURE), (3, PENDING)])
+
+    def testCompactionOnlyKeepsWhatTheResultStoreKept(self):
+        records = []
+        for requestid in range(5):
+            records += [self.enqueue(requestid), self.state(requestid, SUCCESS)]
+        self.write(records)
+        self.results.max_entries = 2
+        self.assertEqual(len(self.restore()), 5)
+        self.assertEqual(sorted(r["requestid"] for r in self.read() if r["type"] == "enqueue"),
+                         [3, 4])
+        # Evicted results don't come back on the next restart.
+        self.journal.close()
+        self.assertEqual(len(Journal().open(self.path, ResultStore())), 2)
+
+    def testPendingWorkKeepsItsArguments(self):
+        enqueue = self.enqueue(1)
+        enqueue["args"] = ["reason"]
+        self.write([enqueue])
+        self.restore()
+        self.assertEqual(self.read()[0]["args"], ["reason"])
+
+    def testUnreadableRecordsAreSkippedAndDropped(self):
+        with open(self.path, "w") as f:
+            f.write(json.dumps(self.enqueue(1)) + "\n")
+            f.write('{"type": "state", "reque')
+        self.assertEqual(len(self.restore()), 1)
+        # Every record left can be read.
+        self.assertEqual([r["requestid"] for r in self.read()], [1, 1])
+
+    def testRecordedWorkIsWrittenOut(self):
+        self.restore()
+        res = ActionResult("slave1", "reboot")
+        self.journal.record_enqueue(res, (), {})
+        self.journal.record_events([res.transition(SUCCESS, "done", 1, 2)])
+        self.journal.flush()
+        self.assertEqual([r["type"] for r in self.read()], ["enqueue", "state"])
+        self.assertEqual(self.read()[1]["state"], SUCCESS)
+
+    def testWritingDoesntBlockOtherGreenlets(self):
+        self.restore()
+        blocking_sleep = get_original("time", "sleep")
+        def slow_fsync(fd):
+            blocking_sleep(0.3)
+        self._saved_fsync = journal_module.os.fsync
+        journal_module.os.fsync = slow_fsync
+        try:
+            ticks = []
+            def tick():
+                while True:
+                    ticks.append(1)
+                    gevent.sleep(0.01)
+            ticker = gevent.spawn(tick)
+            res = ActionResult("slave1", "reboot")
+            self.results.add(res)
+            self.journal.record_enqueue(res, (), {})
+            self.journal.flush()
+            self.journal.compact()
+            ticker.kill()
+        finally:
+            journal_module.os.fsync = self._saved_fsync
+        # Both the flush and the compaction waited on fsync for 0.3 seconds,
+        # while the other greenlet kept running.
+        self.assertTrue(len(ticks) > 20)
+        self.assertEqual([r["type"] for r in self.read()], ["enqueue", "state"])
+
+    def testRecordsMadeDuringCompactionAreKept(self):
+        self.restore()
+        first = ActionResult("slave1", "reboot")
+        self.results.add(first)
+        self.journal.record_enqueue(first, (), {})
+        second = ActionResult("slave2", "reboot")
+        def record_during_compaction(entries):
+            gevent.spawn(self.journal.record_enqueue, second, (), {})
+            gevent.sleep(0.05)
+            return rewrite(entries)
+        rewrite = self.journal._rewrite
+        self.journal._rewrite = record_during_compaction
+        self.journal.compact()
+        self.journal.flush()
+        self.assertEqual([(r["type"], r["requestid"]) for r in self.read()],
+                         [("enqueue", first.id_), ("state", first.id_), ("enqueue", second.id_)])
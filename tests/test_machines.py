@@ -0,0 +1,63 @@
+import unittest
+
+import slaveapi.global_state
+from slaveapi.machines.base import Machine
+from slaveapi.slave import Slave
+
+
+class LocalMachine(Machine):
+    """A Machine that doesn't need DNS, with a loader that counts calls."""
+    lazy_attributes = dict(Machine.lazy_attributes, color="load_paint_info",
+                           finish="load_paint_info")
+
+    def __init__(self, name, color="red"):
+        self.name = name
+        self.domain = "build.mozilla.org"
+        self.color_to_load = color
+        self.loads = 0
+
+    def load_paint_info(self):
+        self.loads += 1
+        if isinstance(self.color_to_load, Exception):
+            raise self.color_to_load
+        self.color = self.color_to_load
+
+
+class TestLazyAttributes(unittest.TestCase):
+    def testAttributesAreLoadedOnFirstUse(self):
+        machine = LocalMachine("machine1")
+        self.assertEqual(machine.loads, 0)
+        self.assertEqual(machine.color, "red")
+        self.assertEqual(machine.color, "red")
+        self.assertEqual(machine.loads, 1)
+
+    def testAttributesTheLoaderDidntSetAreNone(self):
+        machine = LocalMachine("machine1")
+        self.assertEqual(machine.finish, None)
+        self.assertEqual(machine.color, "red")
+        self.assertEqual(machine.loads, 1)
+
+    def testUnknownAttributes(self):
+        machine = LocalMachine("machine1")
+        self.assertRaises(AttributeError, getattr, machine, "size")
+        self.assertFalse(hasattr(machine, "size"))
+        self.assertEqual(getattr(machine, "size", "default"), "default")
+        self.assertEqual(machine.loads, 0)
+
+    def testFailedLoadsAreRetried(self):
+        machine = LocalMachine("machine1", ValueError("broken"))
+        self.assertRaises(ValueError, getattr, machine, "color")
+        machine.color_to_load = "blue"
+        self.assertEqual(machine.color, "blue")
+        self.assertEqual(machine.loads, 2)
+
+    def testGetLoadedDoesntLoad(self):
+        machine = LocalMachine("machine1")
+        self.assertEqual(machine._get_loaded("color"), None)
+        self.assertEqual(machine.loads, 0)
+        machine.color
+        self.assertEqual(machine._get_loaded("color"), "red")
+
+    def testSlavesLoadMachineAttributesToo(self):
+        for name, loader in Machine.lazy_attributes.iteritems():
+            self.assertEqual(Slave.lazy_attributes[name], loader)
@@ -0,0 +1,84 @@
+import unittest
+
+import gevent
+from gevent import queue
+
+import slaveapi.global_state
+from slaveapi import messenger as messenger_module
+from slaveapi.messenger import Messenger
+
+
+class TestMessenger(unittest.TestCase):
+    def setUp(self):
+        self._saved = messenger_module.messages
+        self.messages = messenger_module.messages = queue.Queue()
+        self.messenger = Messenger()
+
+    def tearDown(self):
+        if self.messenger._greenlet:
+            self.messenger._greenlet.kill()
+        messenger_module.messages = self._saved
+
+    def testEventsAreBatchedForEverySubscriber(self):
+        first, second = [], []
+        self.messenger.subscribe(first.append)
+        self.messenger.subscribe(second.append)
+        for i in range(3):
+            self.messages.put(i)
+        self.messenger.start()
+        gevent.sleep(0)
+        self.assertEqual(first, [[0, 1, 2]])
+        self.assertEqual(second, [[0, 1, 2]])
+
+    def testBatchesAreLimited(self):
+        batches = []
+        self.messenger.subscribe(batches.append)
+        self.messenger.max_batch = 2
+        for i in range(5):
+            self.messages.put(i)
+        self.messenger.start()
+        gevent.sleep(0)
+        self.assertEqual(batches, [[0, 1], [2, 3], [4]])
+
+    def testFailingSubscribersDontStopDelivery(self):
+        def broken(events):
+            raise ValueError("broken")
+        batches = []
+        self.messenger.subscribe(broken)
+        self.messenger.subscribe(batches.append)
+        self.messenger.start()
+        self.messages.put(1)
+        gevent.sleep(0)
+        self.messages.put(2)
+        gevent.sleep(0)
+        self.assertEqual(batches, [[1], [2]])
+
+    def testUnsubscribedSubscribersGetNothing(self):
+        first, second = [], []
+        self.messenger.subscribe(first.append)
+        self.messenger.subscribe(second.append)
+        self.messenger.start()
+        self.messages.put(1)
+        gevent.sleep(0)
+        self.messenger.unsubscribe(first.append)
+        self.messages.put(2)
+        gevent.sleep(0)
+        self.assertEqual(first, [[1]])
+        self.assertEqual(second, [[1], [2]])
+        self.assertEqual(len(self.messenger.subscribers), 1)
+
+    def testSubscribersCanUnsubscribeWhileEventsAreDelivered(self):
+        seen = []
+        def once(events):
+            seen.append(events)
+            self.messenger.unsubscribe(once)
+        batches = []
+        self.messenger.subscribe(once)
+        self.messenger.subscribe(batches.append)
+        self.messenger.start()
+        self.messages.put(1)
+        gevent.sleep(0)
+        self.messages.put(2)
+        gevent.sleep(0)
+        self.assertEqual(seen, [[1]])
+        self.assertEqual(batches, [[1], [2]])
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tests.test_ssh import SSHTestCase
+
+from slaveapi.probe import (get_free_disk, get_load, get_os_family, get_unix_uptime,
+                            get_windows_uptime, probe)
+
+DF = """Filesystem     1024-blocks     Used Available Capacity Mounted on
+/dev/sda1         51475068 39150936   9702688      81% /
+"""
+
+
+class TestParsers(unittest.TestCase):
+    def testUnixUptime(self):
+        day = 60 * 60 * 24
+        for text, uptime in [
+                (" 10:38:58 up 78 days, 21:57,  3 users,  load average: 0.01, 0.07, 0.13",
+                 78 * day + 21 * 3600 + 57 * 60),
+                ("10:37  up 1 day, 12:02, 7 users, load averages: 0.62 0.47 0.45",
+                 day + 12 * 3600 + 2 * 60),
+                (" 07:38:12 up 33 min,  1 user,  load average: 4.26, 4.24, 3.51", 33 * 60),
+                (" 10:18:11 up  2:00,  2 users,  load average: 0.07, 0.02, 0.00", 2 * 3600)]:
+            self.assertEqual(get_unix_uptime(text), uptime)
+        self.assertEqual(get_unix_uptime("bash: uptime: command not found"), None)
+
+    def testWindowsUptime(self):
+        self.assertTrue(get_windows_uptime("Statistics since 3/26/2014 7:14:07 AM") > 0)
+        self.assertEqual(get_windows_uptime("Sessions accepted  1"), None)
+
+    def testOSFamily(self):
+        self.assertEqual(get_os_family("Linux\n"), "unix")
+        self.assertEqual(get_os_family("Darwin\n"), "unix")
+        self.assertEqual(get_os_family("MINGW32_NT-6.1\n"), "windows")
+        self.assertEqual(get_os_family(""), None)
+
+    def testLoad(self):
+        self.assertEqual(get_load("load average: 0.01, 0.07, 0.13"), [0.01, 0.07, 0.13])
+        self.assertEqual(get_load("load averages: 0.62 0.47 0.45"), [0.62, 0.47, 0.45])
+        self.assertEqual(get_load("Statistics since 3/26/2014 7:14:07 AM"), None)
+
+    def testFreeDisk(self):
+        self.assertEqual(get_free_disk(DF), 9702688 * 1024)
+        self.assertEqual(get_free_disk("df: /builds/slave: No such file or directory"), None)
+
+
+class TestProbe(SSHTestCase):
+    def setUp(self):
+        SSHTestCase.setUp(self)
+        self.basedir = tempfile.mkdtemp()
+        with open(os.path.join(self.basedir, "twistd.log"), "w") as f:
+            f.write("2014-03-26 07:14:07 slave is ready\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def testUnix(self):
+        server = self.server("bash")
+        self.facts.set(server.address, "os", "unix")
+        info = probe(self.console(server), self.basedir)
+        self.assertEqual(info["os"], "unix")
+        # The stand-in runs batches of commands with the local shell.
+        self.assertTrue(info["uptime"] > 0)
+        self.assertEqual(len(info["load"]), 3)
+        self.assertTrue(info["free_disk"] > 0)
+        self.assertTrue(info["twistd_log"].endswith("slave is ready"))
+        # Everything was found out in one go.
+        self.assertEqual(len(server.commands), 1)
+
+    def testWindowsIsDetected(self):
+        server = self.server("windows")
+        info = probe(self.console(server))
+        self.assertEqual(info["os"], "windows")
+        self.assertEqual(self.facts.get(server.address, "os"), "windows")
+        # Next time, only the Windows command is tried.
+        info = probe(self.console(server))
+        self.assertTrue(info["uptime"] > 0)
+        self.assertEqual(info["load"], None)
+        self.assertTrue("net statistics server" in server.commands)
+
+    def testWithoutBasedir(self):
+        server = self.server("bash")
+        info = probe(self.console(server))
+        self.assertEqual((info["free_disk"], info["twistd_log"]), (None, None))
@@ -0,0 +1,125 @@
+import time
+import unittest
+
+import gevent
+from gevent.queue import Queue
+
+# The processor is created by global_state, which has to be imported first.
+import slaveapi.global_state
+from slaveapi import processor as processor_module
+from slaveapi.actions.results import ResultStore, PENDING, RUNNING, SUCCESS, FAILURE
+from slaveapi.processor import Processor
+
+
+def journal_entry(requestid, state, finish_timestamp=None):
+    entry = {"requestid": requestid, "slave": "slave%d" % requestid,
+             "action": "buildslave_uptime", "args": [], "kwargs": {},
+             "request_timestamp": time.time()}
+    if state != PENDING:
+        entry.update({"state": state, "text": "", "start_timestamp": time.time(),
+                      "finish_timestamp": finish_timestamp or time.time()})
+    return entry
+
+
+class ProcessorTestCase(unittest.TestCase):
+    """Runs a Processor against its own ResultStore and message queue."""
+    def setUp(self):
+        self.results = ResultStore(max_entries=2)
+        self.messages = Queue()
+        self._saved = processor_module.results, processor_module.messages
+        processor_module.results = self.results
+        processor_module.messages = self.messages
+        self.processor = Processor()
+
+    def tearDown(self):
+        processor_module.results, processor_module.messages = self._saved
+
+
+class TestRestore(ProcessorTestCase):
+    def testFinishedResultsAreEvicted(self):
+        self.processor.restore([journal_entry(i, SUCCESS) for i in range(5)])
+        self.results._prune()
+        self.assertEqual(len(self.results), 2)
+        # The least recently finished ones went first.
+        self.assertEqual(sorted(res.id_ for res in self.results), [3, 4])
+
+    def testInterruptedResultsAreFailedAndEvicted(self):
+        self.processor.restore([journal_entry(i, RUNNING) for i in range(5)])
+        self.results._prune()
+        self.assertEqual(len(self.results), 2)
+        self.assertEqual([res.state for res in self.results], [FAILURE, FAILURE])
+        # The failures are sent out for the journal to record.
+        self.assertEqual(self.messages.qsize(), 5)
+
+    def testPendingWorkIsQueuedAndKept(self):
+        self.processor.restore([journal_entry(i, PENDING) for i in range(3)])
+        self.results._prune()
+        self.assertEqual(len(self.results), 3)
+        self.assertEqual(self.processor.work_queue.qsize(), 3)
+
+
+class TestProcess(ProcessorTestCase):
+    def testLaneIsFreedWhenFailingTheResultFails(self):
+        def broken_action(slave):
+            raise Exception("broken")
+        res = self.processor.submit("slave1", broken_action)
+        item = self.processor.work_queue.get()
+
+        def broken_transition(*args):
+            raise Exception("can't transition")
+        self.processor._transition = broken_transition
+        self.assertRaises(Exception, self.processor._process, item)
+        self.assertEqual(self.processor.work_queue.busy, set())
+        self.assertEqual(self.processor.in_flight, {})
+
+
+class TestWorkers(ProcessorTestCase):
+    def action(self, slave):
+        return SUCCESS, "done"
+
+    def run_jobs(self, jobs, **kwargs):
+        self.processor.configure(2, **kwargs)
+        workers = set(self.processor.workers)
+        results = [self.processor.submit("slave%d" % i, self.action) for i in range(jobs)]
+        for res in results:
+            res.wait(5)
+        gevent.sleep(0)
+        self.assertTrue(all(res.state == SUCCESS for res in results))
+        replaced = len(workers - set(self.processor.workers))
+        self.processor.configure(0)
+        return replaced
+
+    def testWorkersAreKeptByDefault(self):
+        self.assertEqual(self.run_jobs(50), 0)
+
+    def testWorkersAreReplacedAfterMaxJobs(self):
+        self.assertEqual(self.run_jobs(50, max_jobs=10), 2)
+
+
+class TestCoalescing(ProcessorTestCase):
+    def action(self, slave, reason=None):
+        return SUCCESS, "done"
+
+    def testIdenticalWorkIsCoalesced(self):
+        first = self.processor.submit("slave1", self.action, kwargs={"reason": "a"})
+        second = self.processor.submit("slave1", self.action, kwargs={"reason": "a"})
+        self.assertTrue(first is second)
+        self.assertEqual(self.processor.work_queue.qsize(), 1)
+
+    def testDifferentWorkIsNotCoalesced(self):
+        first = self.processor.submit("slave1", self.action, kwargs={"reason": "a"})
+        self.assertFalse(first is self.processor.submit("slave1", self.action, kwargs={"reason": "b"}))
+        self.assertFalse(first is self.processor.submit("slave2", self.action, kwargs={"reason": "a"}))
+        self.assertFalse(first is self.processor.submit("slave1", self.action, kwargs={"reason": "a"},
+                                                        coalesce=False))
+        self.assertEqual(self.processor.work_queue.qsize(), 4)
+
+    def testFinishedWorkIsNotCoalesced(self):
+        first = self.processor.submit("slave1", self.action)
+        self.processor._process(self.processor.work_queue.get())
+        self.assertEqual(first.state, SUCCESS)
+        self.assertFalse(first is self.processor.submit("slave1", self.action))
+
+    def testUnhashableArgumentsAreNeverCoalesced(self):
+        first = self.processor.submit("slave1", self.action, kwargs={"reason": ["a"]})
+        self.assertFalse(first is self.processor.submit("slave1", self.action, kwargs={"reason": ["a"]}))
@@ -0,0 +1,98 @@
+import time
+import unittest
+
+from slaveapi.actions.results import ActionResult, ResultStore, SUCCESS
+
+
+def finished(store, res, finish_timestamp=None):
+    """Finishes "res" and tells "store" about it, like the Messenger would."""
+    if finish_timestamp is None:
+        finish_timestamp = time.time()
+    store.record_events([res.transition(SUCCESS, "done", finish_timestamp, finish_timestamp)])
+
+
+class TestEviction(unittest.TestCase):
+    def setUp(self):
+        self.results = ResultStore(max_entries=3, ttl=60)
+
+    def add(self, requestid):
+        res = ActionResult("slave%d" % requestid, "reboot", requestid=requestid)
+        self.results.add(res)
+        return res
+
+    def ids(self):
+        return sorted(res.id_ for res in self.results)
+
+    def testLeastRecentlyUsedFinishedResultsGoFirst(self):
+        for requestid in range(3):
+            finished(self.results, self.add(requestid))
+        # Looking a result up makes it the most recently used.
+        self.results.get("slave0", "reboot", 0)
+        self.add(3)
+        self.assertEqual(self.ids(), [0, 2, 3])
+        self.assertEqual(self.results.get("slave1", "reboot", 1), None)
+        self.assertEqual(self.results.get_action_results("slave1", "reboot"), {})
+
+    def testUnfinishedResultsAreNeverEvicted(self):
+        for requestid in range(5):
+            self.add(requestid)
+        self.assertEqual(len(self.results), 5)
+        finished(self.results, self.results.find(2))
+        self.assertEqual(self.ids(), [0, 1, 3, 4])
+
+    def testExpiredResultsAreEvicted(self):
+        self.results.max_entries = 10
+        old = self.add(1)
+        finished(self.results, old, time.time() - 120)
+        finished(self.results, self.add(2))
+        self.results._last_expire = 0
+        self.results._prune()
+        self.assertEqual(self.ids(), [2])
+
+    def testResultsAddedFinishedCanBeEvicted(self):
+        for requestid in range(5):
+            res = ActionResult("slave%d" % requestid, "reboot", requestid=requestid)
+            res.transition(SUCCESS, "done", time.time(), time.time())
+            self.results.add(res)
+        self.assertEqual(self.ids(), [2, 3, 4])
+
+    def testEventsForEvictedResultsAreIgnored(self):
+        res = self.add(1)
+        self.results.remove(1)
+        finished(self.results, res)
+        self.assertEqual(self.ids(), [])
+        self.assertEqual(len(self.results._finished), 0)
+
+
+class TestSelect(unittest.TestCase):
+    def setUp(self):
+        self.results = ResultStore()
+        for requestid in range(10):
+            slave = "slave%d" % (requestid % 2)
+            self.results.add(ActionResult(slave, "reboot", requestid=requestid))
+
+    def ids(self, page):
+        return [res.id_ for res in page]
+
+    def testPagesCarryOnFromTheCursor(self):
+        page, cursor = self.results.select(limit=4)
+        self.assertEqual((self.ids(page), cursor), ([0, 1, 2, 3], 3))
+        page, cursor = self.results.select(after=cursor, limit=4)
+        self.assertEqual((self.ids(page), cursor), ([4, 5, 6, 7], 7))
+        page, cursor = self.results.select(after=cursor, limit=4)
+        self.assertEqual((self.ids(page), cursor), ([8, 9], None))
+
+    def testSlaveIndex(self):
+        page, cursor = self.results.select(slave="slave1", limit=3)
+        self.assertEqual((self.ids(page), cursor), ([1, 3, 5], 5))
+        self.results.remove(3)
+        page, cursor = self.results.select(slave="slave1")
+        self.assertEqual((self.ids(page), cursor), ([1, 5, 7, 9], None))
+        self.assertEqual(self.results.select(slave="slave2"), ([], None))
+
+    def testScanIsBounded(self):
+        predicate = lambda res: res.id_ == 8
+        page, cursor = self.results.select(limit=5, predicate=predicate, max_scan=4)
+        self.assertEqual((self.ids(page), cursor), ([], 3))
+        page, cursor = self.results.select(after=7, limit=5, predicate=predicate, max_scan=4)
+        self.assertEqual((self.ids(page), cursor), ([8], None))
@@ -0,0 +1,68 @@
+import unittest
+
+from slaveapi.actions.results import ActionResult
+from slaveapi.scheduler import SlaveLanes
+
+
+def work(slave, action="reboot"):
+    return (slave, None, (), {}, ActionResult(slave, action))
+
+
+class TestSlaveLanes(unittest.TestCase):
+    def setUp(self):
+        self.lanes = SlaveLanes()
+        self.lanes.configure(4)
+
+    def drain(self):
+        items = []
+        while True:
+            item = self.lanes.get()
+            if item is None:
+                return items
+            items.append(item)
+
+    def testOneItemRunsPerSlave(self):
+        first, second = work("slave1"), work("slave1")
+        self.lanes.put(first)
+        self.lanes.put(second)
+        self.lanes.put(work("slave2"))
+        running = self.drain()
+        self.assertEqual([item[0] for item in running], ["slave1", "slave2"])
+        self.assertTrue(running[0] is first)
+        self.lanes.done(first)
+        self.assertTrue(self.lanes.get() is second)
+
+    def testShortAndLongNamesShareALane(self):
+        self.lanes.put(work("slave1"))
+        self.lanes.put(work("slave1.build.mozilla.org"))
+        self.assertEqual(len(self.drain()), 1)
+
+    def testHigherPriorityClassesGoFirst(self):
+        self.lanes.put(work("long", "shutdown_buildslave"))
+        self.lanes.put(work("default"))
+        self.lanes.put(work("interactive", "buildslave_uptime"))
+        self.assertEqual([item[0] for item in self.drain()], ["interactive", "default", "long"])
+
+    def testClassesAreLimitedToTheirShare(self):
+        # long gets half of 4 slots.
+        for i in range(4):
+            self.lanes.put(work("long%d" % i, "shutdown_buildslave"))
+        running = self.drain()
+        self.assertEqual(len(running), 2)
+        self.lanes.done(running[0])
+        self.assertEqual(self.lanes.get()[0], "long2")
+
+    def testSlotsAreReservedForInteractiveWork(self):
+        # Enough default and long running work to fill every slot.
+        for i in range(4):
+            self.lanes.put(work("default%d" % i))
+            self.lanes.put(work("long%d" % i, "shutdown_buildslave"))
+        running = self.drain()
+        self.assertEqual(len(running), 3)
+        self.lanes.put(work("interactive", "buildslave_uptime"))
+        self.assertEqual(self.lanes.get()[0], "interactive")
+
+    def testReservationAlwaysLeavesASlot(self):
+        self.lanes.configure(1, reserved=1)
+        self.lanes.put(work("slave1"))
+        self.assertEqual(self.lanes.get()[0], "slave1")
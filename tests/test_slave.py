@@ -0,0 +1,145 @@
+import unittest
+
+from bzrest.errors import BugNotFound
+from requests import HTTPError
+
+import slaveapi.global_state
+from slaveapi import slave as slave_module
+from slaveapi.clients import bugzilla
+from slaveapi.slave import Slave, SlaveInfoCache
+
+
+class FakeBugzilla(object):
+    """Serves a single problem tracking bug, once it exists."""
+    def __init__(self):
+        self.bug = None
+        self.broken = False
+        self.fetches = 0
+        self.created = 0
+
+    def get_bug(self, id_):
+        self.fetches += 1
+        if self.broken:
+            raise HTTPError("500 Server Error")
+        if self.bug is None:
+            raise BugNotFound()
+        return dict(self.bug)
+
+    def create_bug(self, data):
+        self.created += 1
+        self.bug = {"id": 5, "is_open": True, "flags": []}
+        return {"id": 5}
+
+    def request(self, method, path):
+        return {"bugs": []}
+
+
+class FakeSlavealloc(object):
+    """Serves a single slave and its master."""
+    def __init__(self):
+        self.slave = {"enabled": True, "basedir": "/builds/slave", "notes": "",
+                      "current_masterid": 1}
+        self.fetches = 0
+
+    def get_slave(self, api, name):
+        self.fetches += 1
+        return dict(self.slave)
+
+    def get_master(self, api, masterid):
+        return {"fqdn": "master1.build.mozilla.org", "http_port": 8001}
+
+
+class LocalSlave(Slave):
+    """A Slave that doesn't need DNS."""
+    def __init__(self, name):
+        self.name = name
+        self.domain = "build.mozilla.org"
+
+
+class TestBugInfo(unittest.TestCase):
+    def setUp(self):
+        self.bugzilla = FakeBugzilla()
+        self._saved = bugzilla.bugzilla_client, slave_module.info_cache
+        bugzilla.bugzilla_client = self.bugzilla
+        slave_module.info_cache = SlaveInfoCache()
+
+    def tearDown(self):
+        bugzilla.bugzilla_client, slave_module.info_cache = self._saved
+
+    def testBugIsCached(self):
+        self.bugzilla.create_bug({})
+        LocalSlave("slave1").load_bug_info()
+        slave = LocalSlave("slave1")
+        slave.load_bug_info()
+        self.assertEqual(slave.bug.id_, 5)
+        self.assertEqual(self.bugzilla.fetches, 1)
+
+    def testEachSlaveGetsItsOwnCopy(self):
+        self.bugzilla.create_bug({})
+        first = LocalSlave("slave1")
+        first.load_bug_info()
+        first.bug.data["is_open"] = False
+        first.bug.data["flags"].append("changed")
+        second = LocalSlave("slave1")
+        second.load_bug_info()
+        self.assertEqual(second.bug.data, {"id": 5, "is_open": True, "flags": []})
+
+    def testMissingBugIsNotCached(self):
+        LocalSlave("slave1").load_bug_info()
+        # Someone else files the bug in the meantime.
+        self.bugzilla.bug = {"id": 5, "is_open": True}
+        slave = LocalSlave("slave1")
+        slave.load_bug_info(createIfMissing=True)
+        self.assertEqual(slave.bug.id_, 5)
+        self.assertEqual(self.bugzilla.created, 0)
+
+    def testBugThatCouldNotBeFetchedIsNotCached(self):
+        self.bugzilla.create_bug({})
+        self.bugzilla.broken = True
+        LocalSlave("slave1").load_bug_info()
+        self.bugzilla.broken = False
+        slave = LocalSlave("slave1")
+        slave.load_bug_info()
+        self.assertEqual(slave.bug.data["id"], 5)
+        self.assertEqual(self.bugzilla.fetches, 2)
+
+    def testFreshBugInfoSkipsTheCache(self):
+        self.bugzilla.create_bug({})
+        LocalSlave("slave1").load_bug_info()
+        self.bugzilla.bug["is_open"] = False
+        slave = LocalSlave("slave1")
+        slave.load_bug_info(fresh=True)
+        self.assertEqual(slave.bug.data["is_open"], False)
+        self.assertEqual(self.bugzilla.fetches, 2)
+
+
+class TestSlavealloc(unittest.TestCase):
+    def setUp(self):
+        self.slavealloc = FakeSlavealloc()
+        self._saved = slave_module.slavealloc, slave_module.info_cache, dict(slave_module.config)
+        slave_module.slavealloc = self.slavealloc
+        slave_module.info_cache = SlaveInfoCache()
+        slave_module.config["slavealloc_api_url"] = "http://slavealloc"
+
+    def tearDown(self):
+        slave_module.slavealloc, slave_module.info_cache, config = self._saved
+        slave_module.config.clear()
+        slave_module.config.update(config)
+
+    def testSlaveallocInfoIsCached(self):
+        LocalSlave("slave1").load_slavealloc_info()
+        self.slavealloc.slave["enabled"] = False
+        slave = LocalSlave("slave1")
+        self.assertEqual(slave.enabled, True)
+        self.assertEqual(self.slavealloc.fetches, 1)
+
+    def testFreshSlaveallocInfoSkipsTheCache(self):
+        LocalSlave("slave1").load_slavealloc_info()
+        self.slavealloc.slave["enabled"] = False
+        slave = LocalSlave("slave1")
+        slave.load_slavealloc_info(fresh=True)
+        self.assertEqual(slave.enabled, False)
+        self.assertEqual(self.slavealloc.fetches, 2)
+        # The fresh information is cached for everyone else.
+        self.assertEqual(LocalSlave("slave1").enabled, False)
+        self.assertEqual(self.slavealloc.fetches, 2)
@@ -0,0 +1,275 @@
+# paramiko runs the stand-in server in threads, which have to be greenlets
+# for it to make progress while the tests block on the client side.
+from gevent import monkey; monkey.patch_all()
+
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+import gevent
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+from ssh_server import StandInSSHServer
+
+from slaveapi.clients.ssh import (ChannelReader, CredentialCache, OutputBuffer, RemoteCommandError,
+                                  SSHConsole, SSHConnectionPool)
+from slaveapi.facts import HostFacts
+
+credentials = {"cltbld": ["password"]}
+
+
+class FakeChannel(object):
+    """Hands out "chunks" one read at a time, like SSHConsole._recv() would
+    for a real channel, and then an empty string once they've run out."""
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.reads = 0
+
+    def _recv(self, channel, deadline, size):
+        self.reads += 1
+        if self.chunks:
+            return self.chunks.pop(0)
+        return ""
+
+
+class TestOutputBuffer(unittest.TestCase):
+    def testSmallOutputIsKept(self):
+        buf = OutputBuffer(10)
+        buf.append("abc")
+        buf.append("def")
+        self.assertEqual(buf.getvalue(), "abcdef")
+        self.assertEqual(buf.truncated, 0)
+
+    def testTheMiddleOfLargeOutputIsDropped(self):
+        buf = OutputBuffer(10)
+        for chunk in ("abcd", "efgh", "ijkl", "mnop"):
+            buf.append(chunk)
+        self.assertEqual(buf.getvalue(), "abcde" + OutputBuffer.truncation_marker % 6 + "lmnop")
+
+    def testUnlimited(self):
+        buf = OutputBuffer()
+        buf.append("x" * 100000)
+        self.assertEqual(len(buf.getvalue()), 100000)
+
+
+class TestChannelReader(unittest.TestCase):
+    sentinel = re.compile(r"DONE (\d+)\n")
+
+    def reader(self, chunks, max_size=None):
+        channel = FakeChannel(chunks)
+        return channel, ChannelReader(channel, channel, max_size)
+
+    def testOutputIsSplitAtSentinels(self):
+        channel, reader = self.reader(["one\nDONE 0\ntwo\nDO", "NE 1\nthree"])
+        buf, match = reader.read_until(self.sentinel, 10, time.time() + 10)
+        self.assertEqual((buf.getvalue(), match.group(1)), ("one\n", "0"))
+        # The second sentinel is split across two reads.
+        buf, match = reader.read_until(self.sentinel, 10, time.time() + 10)
+        self.assertEqual((buf.getvalue(), match.group(1)), ("two\n", "1"))
+        buf, match = reader.read_until(self.sentinel, 10, time.time() + 10)
+        self.assertEqual((buf.getvalue(), match), ("three", None))
+
+    def testReadingUntilTheChannelCloses(self):
+        channel, reader = self.reader(["one\n", "two\n"])
+        buf, match = reader.read_until(None, 0, time.time() + 10)
+        self.assertEqual((buf.getvalue(), match), ("one\ntwo\n", None))
+        self.assertEqual(channel.reads, 3)
+
+    def testOutputIsBounded(self):
+        channel, reader = self.reader(["x" * 1000] * 100 + ["DONE 0\n"], max_size=100)
+        buf, match = reader.read_until(self.sentinel, 10, time.time() + 10)
+        self.assertEqual(match.group(1), "0")
+        self.assertEqual(buf.truncated, 100000 - 100)
+        self.assertEqual(len(buf.getvalue()), 100 + len(OutputBuffer.truncation_marker % buf.truncated))
+
+
+class SSHTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pool = SSHConnectionPool()
+        self.facts = HostFacts()
+
+    def server(self, host_type, credentials=credentials, address="127.0.0.1"):
+        return StandInSSHServer(host_type, credentials, address).start()
+
+    def console(self, server, credentials=credentials, **kwargs):
+        kwargs.setdefault("pool", self.pool)
+        kwargs.setdefault("facts", self.facts)
+        return SSHConsole(server.address, credentials, port=server.port, **kwargs)
+
+
+class TestCommands(SSHTestCase):
+    def testExecIsUsedWhereSupported(self):
+        server = self.server("bash")
+        console = self.console(server)
+        self.assertEqual(console.run_cmd("echo out; echo err >&2; exit 3"), (3, "out\nerr"))
+        # The command went straight to "exec", without a shell.
+        self.assertEqual(server.commands, ["echo out; echo err >&2; exit 3"])
+        self.assertEqual(self.facts.get(server.address, "shell"), None)
+
+    def testExecGetsAPty(self):
+        # Otherwise "sudo" fails on hosts whose sudoers has "requiretty".
+        server = self.server("bash")
+        self.console(server).run_cmd("true")
+        self.assertEqual(server.pty_requests, 1)
+
+    def testShellIsUsedWhereExecIsRefused(self):
+        server = self.server("windows")
+        console = self.console(server)
+        rc, output = console.run_cmd("net statistics server")
+        self.assertEqual(rc, 0)
+        self.assertTrue("Sessions accepted" in output)
+        self.assertEqual(self.facts.get(server.address, "shell"), "pty")
+        # Later commands go straight to the shell.
+        self.assertEqual(console.run_cmd("uptime")[0], 127)
+        self.assertEqual(server.commands.count("uptime"), 1)
+
+
+class TestConnectionPool(SSHTestCase):
+    def testConnectionsAreReused(self):
+        server = self.server("bash")
+        self.console(server).run_cmd("true")
+        console = self.console(server)
+        console.run_cmd("true")
+        console.run_cmd("true")
+        self.assertEqual((server.connections, server.auth_attempts), (1, 1))
+
+    def testDeadConnectionsAreReplaced(self):
+        server = self.server("bash")
+        console = self.console(server)
+        console.connect()
+        client = console.client
+        console.disconnect()
+        # The connection goes away while it's idle in the pool.
+        client.close()
+        self.assertEqual(console.run_cmd("echo hi"), (0, "hi"))
+        self.assertEqual(server.connections, 2)
+        # The slot that the dead connection held was given back.
+        self.assertEqual(self.pool._slots[server.address].counter, self.pool.max_per_host - 1)
+
+    def testConnectionsAreNotReusedAfterErrors(self):
+        server = self.server("bash")
+        console = self.console(server)
+        console.connect()
+        client = console.client
+        console.disconnect(reuse=False)
+        self.assertFalse(client.get_transport())
+        console.run_cmd("true")
+        self.assertEqual(server.connections, 2)
+
+
+class TestCredentialCache(SSHTestCase):
+    credentials = {"cltbld": ["old", "new"]}
+
+    def setUp(self):
+        SSHTestCase.setUp(self)
+        self.cache = CredentialCache()
+
+    def login(self, server, name):
+        console = self.console(server, self.credentials, pool=None, name=name,
+                               credential_cache=self.cache)
+        console.connect()
+        console.disconnect()
+
+    def testWorkingCredentialsAreTriedFirst(self):
+        # "flaky" hosts reject the first password.
+        server = self.server("flaky", self.credentials, "127.0.0.2")
+        self.login(server, "t-host-1")
+        self.login(server, "t-host-1")
+        self.assertEqual(server.auth_attempts, 3)
+
+    def testSimilarlyNamedHostsShareCredentials(self):
+        first = self.server("flaky", self.credentials, "127.0.0.2")
+        second = self.server("flaky", self.credentials, "127.0.0.3")
+        self.login(first, "t-host-1")
+        self.login(second, "t-host-2")
+        self.assertEqual((first.auth_attempts, second.auth_attempts), (2, 1))
+
+    def testCredentialsThatStopWorkingAreForgotten(self):
+        server = self.server("bash", {"cltbld": ["new"]}, "127.0.0.2")
+        self.login(server, "t-host-1")
+        self.assertEqual(self.cache.preferred(server.address, "t-host-1"), [("cltbld", "new")])
+        server.credentials = {"cltbld": ["old"]}
+        server.auth_attempts = 0
+        self.login(server, "t-host-1")
+        # The cached password is tried first, and isn't tried again.
+        self.assertEqual(server.auth_attempts, 2)
+        self.assertEqual(self.cache.preferred(server.address, "t-host-1"), [("cltbld", "old")])
+
+
+class TestRunCmds(SSHTestCase):
+    def testAllCommandsRunInOneSession(self):
+        server = self.server("bash")
+        results = self.console(server).run_cmds(["echo one", "false", "echo three"])
+        self.assertEqual(results, [(0, "one"), (1, ""), (0, "three")])
+        self.assertEqual(len(server.commands), 1)
+
+    def testStopOnSuccess(self):
+        server = self.server("bash")
+        results = self.console(server).run_cmds(["false", "echo two", "echo three"],
+                                                stop_on_success=True)
+        self.assertEqual(results, [(1, ""), (0, "two")])
+
+    def testNothingSucceeds(self):
+        server = self.server("bash")
+        results = self.console(server).run_cmds(["false", "exit 2"], stop_on_success=True)
+        self.assertEqual(results, [(1, ""), (2, "")])
+
+    def testStopOnSuccessThroughAShell(self):
+        server = self.server("windows")
+        results = self.console(server).run_cmds(["uptime", "net statistics server", "uname -s"],
+                                                stop_on_success=True)
+        self.assertEqual([rc for rc, _ in results], [127, 0])
+        self.assertFalse("uname -s" in server.commands)
+
+
+class TestFollow(SSHTestCase):
+    def setUp(self):
+        SSHTestCase.setUp(self)
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "twistd.log")
+        self.write("starting\n")
+        self.stand_in = self.server("bash")
+        self.follower = self.console(self.stand_in)
+        self.follower.follow_idle_timeout = 0.2
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, data, delay=0):
+        gevent.sleep(delay)
+        with open(self.path, "a") as f:
+            f.write(data)
+
+    def testMatchingLinesAreReturnedAsSoonAsTheyShowUp(self):
+        gevent.spawn(self.write, "nothing here\nshutdown complete\n", 0.5)
+        start = time.time()
+        line = self.follower.follow(self.path, ["complete"], 10)
+        self.assertEqual(line, "shutdown complete")
+        self.assertTrue(time.time() - start < 2)
+
+    def testTimeout(self):
+        self.assertEqual(self.follower.follow(self.path, ["complete"], 0.5), None)
+
+    def testSilentlyLostConnectionsAreNoticed(self):
+        def lose_connection():
+            gevent.sleep(0.3)
+            self.follower.client.get_transport().is_active = lambda: False
+        gevent.spawn(lose_connection)
+        start = time.time()
+        self.assertRaises(RemoteCommandError, self.follower.follow, self.path, ["complete"], 10)
+        self.assertTrue(time.time() - start < 2)
+
+    def testFollowingAgainAfterLosingTheConnection(self):
+        def close_connection():
+            gevent.sleep(0.3)
+            self.follower.client.get_transport().close()
+        gevent.spawn(close_connection)
+        self.assertRaises(RemoteCommandError, self.follower.follow, self.path, ["complete"], 10)
+        self.assertFalse(self.follower.connected)
+        gevent.spawn(self.write, "shutdown complete\n", 0.5)
+        self.assertEqual(self.follower.follow(self.path, ["complete"], 10), "shutdown complete")
+        self.assertEqual(self.stand_in.connections, 2)
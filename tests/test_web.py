@@ -0,0 +1,236 @@
+import json
+import time
+import unittest
+
+import gevent
+from gevent.queue import Queue
+
+import slaveapi.global_state
+from slaveapi import processor as processor_module
+from slaveapi.actions.results import (ActionResult, BatchStore, ResultStore, PENDING, RUNNING,
+                                      SUCCESS, FAILURE)
+from slaveapi.messenger import Messenger
+from slaveapi.processor import Processor
+from slaveapi.web import action_base, app, events
+from slaveapi.web import batches as batches_view
+from slaveapi.web import results as results_view
+from slaveapi.web.slave import action_views
+
+
+class TestActionRegistration(unittest.TestCase):
+    def testBatchesAcceptEveryActionURL(self):
+        prefix = "/slaves/<slave>/actions/"
+        registered = dict((rule.rule[len(prefix):], app.view_functions[rule.endpoint].view_class)
+                          for rule in app.url_map.iter_rules()
+                          if rule.rule.startswith(prefix))
+        self.assertEqual(registered, action_views)
+
+
+class WebTestCase(unittest.TestCase):
+    """Gives the views their own ResultStore and Messenger."""
+    def setUp(self):
+        self.results = ResultStore()
+        self.messenger = Messenger()
+        self._saved = (action_base.results, events.results, results_view.results,
+                       events.messenger)
+        action_base.results = events.results = results_view.results = self.results
+        events.messenger = self.messenger
+        self.client = app.test_client()
+
+    def tearDown(self):
+        (action_base.results, events.results, results_view.results,
+         events.messenger) = self._saved
+
+    def result(self, slave="slave1", action="buildslave_uptime"):
+        res = ActionResult(slave, action)
+        self.results.add(res)
+        return res
+
+    def later(self, delay, res, state):
+        """Moves "res" to "state" after "delay" seconds, and hands the
+        event to the Messenger's subscribers like it would."""
+        def transition():
+            gevent.sleep(delay)
+            event = res.transition(state, "", time.time())
+            for subscriber in list(self.messenger.subscribers):
+                subscriber([event])
+        gevent.spawn(transition)
+
+
+class TestLongPoll(WebTestCase):
+    url = "/slaves/slave1/actions/get_uptime"
+
+    def get(self, **args):
+        return self.client.get(self.url, query_string=args)
+
+    def testWaitReturnsOnStateChange(self):
+        res = self.result()
+        self.later(0.1, res, RUNNING)
+        start = time.time()
+        data = json.loads(self.get(requestid=res.id_, wait=10).data)
+        self.assertEqual(data["state"], RUNNING)
+        self.assertTrue(time.time() - start < 5)
+
+    def testWaitTimesOut(self):
+        res = self.result()
+        start = time.time()
+        data = json.loads(self.get(requestid=res.id_, wait=1).data)
+        self.assertEqual(data["state"], PENDING)
+        self.assertTrue(time.time() - start >= 1)
+
+    def testStaleStateReturnsRightAway(self):
+        res = self.result()
+        res.transition(RUNNING, "")
+        start = time.time()
+        data = json.loads(self.get(requestid=res.id_, wait=10, state=PENDING).data)
+        self.assertEqual(data["state"], RUNNING)
+        self.assertTrue(time.time() - start < 5)
+
+    def testFinishedResultsReturnRightAway(self):
+        res = self.result()
+        res.transition(SUCCESS, "done")
+        start = time.time()
+        self.assertEqual(json.loads(self.get(requestid=res.id_, wait=10).data)["state"], SUCCESS)
+        self.assertTrue(time.time() - start < 5)
+
+    def testBadArguments(self):
+        res = self.result()
+        self.assertEqual(self.get(requestid=res.id_, wait="soon").status_code, 400)
+        self.assertEqual(self.get(requestid=res.id_, wait=1, state="done").status_code, 400)
+        self.assertEqual(self.get(requestid="abc").status_code, 400)
+
+
+class TestEvents(WebTestCase):
+    def stream(self, **args):
+        """Returns an iterator over the events of an /events stream."""
+        response = self.client.get("/events", query_string=args)
+        self.assertEqual(response.mimetype, "text/event-stream")
+        for chunk in response.response:
+            if chunk.startswith("data: "):
+                yield json.loads(chunk[len("data: "):])
+
+    def testRequestStreamEndsWhenItFinishes(self):
+        res = self.result()
+        self.later(0.1, res, RUNNING)
+        self.later(0.2, res, SUCCESS)
+        events = list(self.stream(requestid=res.id_))
+        self.assertEqual([e["state"] for e in events], [PENDING, RUNNING, SUCCESS])
+        self.assertEqual(events[0]["requestid"], res.id_)
+        # The stream stopped listening once it ended.
+        self.assertEqual(self.messenger.subscribers, [])
+
+    def testFinishedRequestIsSentOnce(self):
+        res = self.result()
+        res.transition(FAILURE, "broken")
+        self.assertEqual([e["state"] for e in self.stream(requestid=res.id_)], [FAILURE])
+        self.assertEqual(self.messenger.subscribers, [])
+
+    def testEventsAreFiltered(self):
+        other = self.result("slave2")
+        res = self.result("slave1")
+        self.later(0.1, other, RUNNING)
+        self.later(0.2, res, RUNNING)
+        stream = self.stream(slave="slave1")
+        event = next(stream)
+        self.assertEqual((event["slave"], event["state"]), ("slave1", RUNNING))
+        # Closing the stream, as happens when the client goes away, stops it
+        # listening.
+        stream.close()
+        gevent.sleep(0)
+        self.assertEqual(self.messenger.subscribers, [])
+
+    def testUnknownRequests(self):
+        self.assertEqual(self.client.get("/events?requestid=1").status_code, 404)
+        self.assertEqual(self.client.get("/events?requestid=abc").status_code, 400)
+
+
+class TestResultsPaging(WebTestCase):
+    def page(self, **args):
+        response = self.client.get("/results", query_string=args)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        ids = sorted(int(id_) for slave in data.values()
+                     for action in slave.values() for id_ in action)
+        return ids, response.headers.get("X-Next-Cursor")
+
+    def testPages(self):
+        ids = [self.result("slave%d" % i).id_ for i in range(5)]
+        self.assertEqual(self.page(limit=3), (ids[:3], str(ids[2])))
+        self.assertEqual(self.page(limit=3, cursor=ids[2]), (ids[3:], None))
+
+    def testLimitMustBeAtLeastOne(self):
+        self.result()
+        for limit in ("0", "-1", "abc"):
+            self.assertEqual(self.client.get("/results?limit=%s" % limit).status_code, 400)
+
+    def testLimitIsCapped(self):
+        ids = [self.result("slave%d" % i).id_ for i in range(5)]
+        saved, results_view.Results.max_limit = results_view.Results.max_limit, 2
+        try:
+            self.assertEqual(self.page(limit=1000), (ids[:2], str(ids[1])))
+        finally:
+            results_view.Results.max_limit = saved
+
+
+class TestBatches(WebTestCase):
+    def setUp(self):
+        WebTestCase.setUp(self)
+        # A Processor without workers, so that everything stays pending.
+        self.processor = Processor()
+        self.batches = BatchStore()
+        self._saved_batches = (batches_view.processor, batches_view.batches, batches_view.get_slaves,
+                               processor_module.results, processor_module.messages)
+        batches_view.processor = self.processor
+        batches_view.batches = self.batches
+        batches_view.get_slaves = self.get_slaves
+        processor_module.results = self.results
+        processor_module.messages = Queue()
+        self._saved_api_url = batches_view.config.get("slavealloc_api_url")
+        batches_view.config["slavealloc_api_url"] = "http://slavealloc/api"
+        self.slavealloc_queries = []
+
+    def tearDown(self):
+        (batches_view.processor, batches_view.batches, batches_view.get_slaves,
+         processor_module.results, processor_module.messages) = self._saved_batches
+        batches_view.config["slavealloc_api_url"] = self._saved_api_url
+        WebTestCase.tearDown(self)
+
+    def get_slaves(self, api, purposes, environs, pools, enabled):
+        self.slavealloc_queries.append((purposes, environs, pools, enabled))
+        return [{"name": "slave1"}, {"name": "slave2"}]
+
+    def post(self, **form):
+        return self.client.post("/batches", data=form)
+
+    def testActionIsRequestedForEverySlave(self):
+        response = self.post(action="get_uptime", slaves=["slave1", "slave2"])
+        self.assertEqual(response.status_code, 202)
+        data = json.loads(response.data)
+        self.assertEqual(data["action"], "buildslave_uptime")
+        self.assertEqual(sorted(data["requestids"]), ["slave1", "slave2"])
+        self.assertEqual(data["counts"]["pending"], 2)
+        self.assertEqual(self.processor.work_queue.qsize(), 2)
+        # Progress can be looked up later.
+        response = self.client.get("/batches/%d" % data["batchid"])
+        self.assertEqual(json.loads(response.data)["requestids"], data["requestids"])
+
+    def testDuplicateSlavesAreRequestedOnce(self):
+        response = self.post(action="get_uptime", slaves=["slave1", "slave2", "slave1", "slave1"],
+                             coalesce="false")
+        data = json.loads(response.data)
+        self.assertEqual(data["counts"]["total"], 2)
+        self.assertEqual(data["duplicates"], ["slave1"])
+        self.assertEqual(self.processor.work_queue.qsize(), 2)
+
+    def testSlaveallocFilters(self):
+        data = json.loads(self.post(action="get_uptime", pool="pool1", enabled="yes").data)
+        self.assertEqual(sorted(data["requestids"]), ["slave1", "slave2"])
+        data = json.loads(self.post(action="get_uptime", pool="pool1", enabled="false").data)
+        self.assertEqual([enabled for _, _, _, enabled in self.slavealloc_queries], ["1", "0"])
+
+    def testBadRequests(self):
+        self.assertEqual(self.post(action="explode", slaves="slave1").status_code, 400)
+        self.assertEqual(self.post(action="get_uptime").status_code, 400)
+        self.assertEqual(self.post(action="get_uptime", pool="pool1", enabled="maybe").status_code, 400)
+        self.assertEqual(self.slavealloc_queries, [])
+        self.assertEqual(self.processor.work_queue.qsize(), 0)